@@ -1,19 +1,92 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import IndexModel, ASCENDING, TEXT
-from pymongo.errors import OperationFailure
+from pymongo.errors import BulkWriteError, CollectionInvalid, OperationFailure
+from pymongo.operations import SearchIndexModel
+import asyncio
 import os
 from typing import Optional, Dict, Any
 import functools
 
+# Projection that leaves out the embedding vectors and _id, for documents returned by the API
+NO_EMBEDDING_PROJECTION = {"_id": 0, "title_embedding": 0, "description_embedding": 0}
+
+# Name of the Atlas Vector Search index over the product embeddings
+VECTOR_INDEX_NAME = "vector_index"
+
+# Case-insensitive collation for brand lookups; queries must pass the same collation to use its index
+CASE_INSENSITIVE_COLLATION = {"locale": "en", "strength": 2}
+
+# Quantization Atlas applies to indexed vectors: "none", "scalar" (int8) or "binary"
+VECTOR_INDEX_QUANTIZATION = os.getenv("VECTOR_INDEX_QUANTIZATION", "scalar")
+
+# Definition of the vector search index. Embeddings are stored as float32 BSON
+# vectors, which require the vectorSearch index type ("vector" fields) rather
+# than knnVector mappings. With scalar quantization Atlas also keeps an int8
+# copy of each vector for the ANN graph, cutting index memory and bandwidth
+# about 4x; the float32 vectors stay stored, so queries keep sending float32 vectors.
+VECTOR_INDEX_DEFINITION = {
+    "fields": [
+        {
+            "type": "vector",
+            "path": "title_embedding",
+            "numDimensions": 384,  # Dimensions for paraphrase-multilingual-MiniLM-L12-v2
+            "similarity": "cosine",
+            "quantization": VECTOR_INDEX_QUANTIZATION
+        },
+        {
+            "type": "vector",
+            "path": "description_embedding",
+            "numDimensions": 384,
+            "similarity": "cosine",
+            "quantization": VECTOR_INDEX_QUANTIZATION
+        }
+    ]
+}
+
+# Server error code returned when creating an index that already exists
+INDEX_ALREADY_EXISTS = 68
+
+# Maximum number of operations sent in one bulkWrite command by bulk_write_concurrent
+BULK_WRITE_CHUNK_SIZE = int(os.getenv("MONGODB_BULK_WRITE_CHUNK_SIZE", "1000"))
+
+# Connection pool settings, sized for concurrent FastAPI request handling
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "200"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "20"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "60000"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+# Wire compression; compressors whose libraries are not installed are skipped by the driver
+MONGODB_COMPRESSORS = os.getenv("MONGODB_COMPRESSORS", "zstd,snappy,zlib")
+
 # Database connection objects with lazy initialization
 class DB:
     client: Optional[AsyncIOMotorClient] = None
     db = None
     initialized = False
+    # Serializes lazy initialization so concurrent callers share one client
+    _init_lock = asyncio.Lock()
+    
+    @classmethod
+    async def initialize_async(cls, uri: Optional[str] = None, db_name: Optional[str] = None):
+        """
+        Initialize the database connection from async code paths.
+        Concurrent first callers wait on the lock, so only one of them
+        creates a client and the rest reuse it.
+        """
+        if cls.initialized:
+            return
+        async with cls._init_lock:
+            if cls.initialized:
+                return
+            cls.initialize(uri, db_name)
     
     @classmethod
     def initialize(cls, uri: Optional[str] = None, db_name: Optional[str] = None):
-        """Initialize database connection"""
+        """
+        Initialize database connection.
+        Only safe where no other initialization can run concurrently, such as
+        the application lifespan; lazy callers should use initialize_async.
+        """
         if cls.initialized and cls.client and cls.db:
             return
             
@@ -32,104 +105,209 @@ class DB:
             else:
                 database_name = "productdb"
         
-        try:
-            cls.client = AsyncIOMotorClient(mongodb_uri)
-            cls.db = cls.client[database_name]
-            cls.initialized = True
-        except Exception as e:
-            print(f"Failed to initialize MongoDB connection: {e}")
-            # For testing environments, provide a mock DB
-            if os.getenv("TESTING", "false").lower() == "true":
-                print("Using mock database for testing")
-                from unittest.mock import MagicMock, AsyncMock
-                cls.client = MagicMock()
-                cls.db = MagicMock()
-                cls.db.command = AsyncMock(return_value={"ok": 1})
-                cls.db.list_collection_names = AsyncMock(return_value=["products", "orderlines", "product_pairs"])
-                cls.db.products = MagicMock()
-                cls.db.orderlines = MagicMock()
-                cls.db.product_pairs = MagicMock()
-                cls.initialized = True
+        cls.client = AsyncIOMotorClient(
+            mongodb_uri,
+            maxPoolSize=MONGODB_MAX_POOL_SIZE,
+            minPoolSize=MONGODB_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGODB_MAX_IDLE_TIME_MS,
+            serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+            waitQueueTimeoutMS=MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+            compressors=MONGODB_COMPRESSORS,
+            retryWrites=True,
+            # Acknowledge writes only once a majority of the replica set has them,
+            # so retried unordered batches cannot lose writes on failover
+            w="majority"
+        )
+        cls.db = cls.client[database_name]
+        cls.initialized = True
+    
+    @classmethod
+    def initialize_for_testing(cls):
+        """
+        Initialize the connection with mock objects for the test harness.
+        Kept separate from initialize so connection errors are never masked
+        by a mock outside of tests.
+        """
+        from unittest.mock import MagicMock, AsyncMock
+        cls.client = MagicMock()
+        cls.db = MagicMock()
+        cls.db.command = AsyncMock(return_value={"ok": 1})
+        cls.db.list_collection_names = AsyncMock(return_value=["products", "orderlines", "product_pairs"])
+        cls.db.products = MagicMock()
+        cls.db.orderlines = MagicMock()
+        cls.db.product_pairs = MagicMock()
+        cls.initialized = True
 
 # Singleton instance
 db = DB()
 
+# Collection handles bound by bind_collections() during application startup
+products_collection = None
+orderlines_collection = None
+product_pairs_collection = None
+
+async def _build_product_indexes():
+    """Create the products collection indexes"""
+    try:
+        # Basic indexes for common queries plus the text index for keyword searches,
+        # created in a single createIndexes command
+        product_indexes = [
+            IndexModel([("id", ASCENDING)], unique=True),
+            IndexModel([("brand", ASCENDING)]),
+            # Case-insensitive brand index for prefix lookups
+            IndexModel([("brand", ASCENDING)], collation=CASE_INSENSITIVE_COLLATION, name="brand_ci"),
+            IndexModel([("color", ASCENDING)]),
+            IndexModel([("productType", ASCENDING)]),
+            # Multikey indexes for the consolidated category search; its regex $match
+            # scans these index keys instead of every product document
+            IndexModel([("categories.name", ASCENDING)]),
+            IndexModel([("categories.slug", ASCENDING)]),
+            IndexModel([
+                ("title", TEXT),
+                ("description", TEXT),
+                ("brand", TEXT)
+            ], default_language="norwegian")
+        ]
+        await db.db.products.create_indexes(product_indexes)
+    except OperationFailure as e:
+        print(f"Error creating product indexes: {e}")
+        # Continue anyway as this might be a permissions issue or the indexes already exist
+
+async def _build_vector_search_index():
+    """
+    Create the Atlas Vector Search index over the product embeddings.
+    An existing index with the same name is only updated when its definition
+    differs, since every update makes Atlas rebuild the index.
+    """
+    vector_index = SearchIndexModel(
+        definition=VECTOR_INDEX_DEFINITION,
+        name=VECTOR_INDEX_NAME,
+        type="vectorSearch"
+    )
+    try:
+        await db.db.products.create_search_index(vector_index)
+    except OperationFailure as e:
+        if e.code == INDEX_ALREADY_EXISTS or "already exists" in str(e):
+            await _update_vector_search_index(VECTOR_INDEX_DEFINITION)
+            return
+        # Search indexes are only available on Atlas deployments
+        print(f"Error creating vector search index: {e}")
+
+async def _update_vector_search_index(definition: dict):
+    """Apply the vector index definition to an existing index if it changed"""
+    try:
+        existing = await db.db.products.list_search_indexes(VECTOR_INDEX_NAME).to_list(1)
+        if existing and existing[0].get("latestDefinition") != definition:
+            await db.db.products.update_search_index(VECTOR_INDEX_NAME, definition)
+            print(f"Updated vector search index {VECTOR_INDEX_NAME}")
+    except OperationFailure as e:
+        print(f"Error updating vector search index: {e}")
+
+async def _build_orderline_indexes():
+    """Create the orderlines collection indexes"""
+    try:
+        # (orderNr, productNr) also serves orderNr lookups, and (productNr, orderNr)
+        # covers the "orders containing this product" step of co-occurrence queries
+        orderline_indexes = [
+            IndexModel([("orderNr", ASCENDING), ("productNr", ASCENDING)]),
+            IndexModel([("customerNr", ASCENDING)]),
+            IndexModel([("productNr", ASCENDING), ("orderNr", ASCENDING)])
+        ]
+        await db.db.orderlines.create_indexes(orderline_indexes)
+    except OperationFailure as e:
+        print(f"Error creating orderline indexes: {e}")
+
+async def _ensure_product_pairs_collection():
+    """Ensure the product_pairs collection used by the recommender exists"""
+    try:
+        await db.db.create_collection("product_pairs")
+    except CollectionInvalid:
+        # Collection already exists
+        pass
+    except OperationFailure as e:
+        print(f"Error creating product_pairs collection: {e}")
+
 async def init_indexes():
     """
     Initialize the necessary indexes for MongoDB collections.
-    This includes text indexes and vector indexes for search functionality.
+    This includes text indexes and the Atlas vector search index.
+    
+    The collections are independent, so their setup commands are issued
+    concurrently and each one reports its own failure.
     """
-    # Product collection indexes
-    try:
-        # Basic indexes for common queries
-        await db.db.products.create_index("id", unique=True)
-        await db.db.products.create_index("brand")
-        await db.db.products.create_index("color")
-        await db.db.products.create_index("productType")
-        
-        # Text index for keyword searches
-        await db.db.products.create_index([
-            ("title", "text"), 
-            ("description", "text"),
-            ("brand", "text")
-        ], default_language="norwegian")
-        
-        # Vector index for MongoDB Atlas Search
-        # Note: This is a simplified version. For a real MongoDB Atlas deployment,
-        # you would need to configure this through the Atlas UI or API
-        vector_index = {
-            "mappings": {
-                "dynamic": True,
-                "fields": {
-                    "title_embedding": {
-                        "type": "knnVector",
-                        "dimensions": 384,  # Dimensions for paraphrase-multilingual-MiniLM-L12-v2
-                        "similarity": "cosine"
-                    },
-                    "description_embedding": {
-                        "type": "knnVector",
-                        "dimensions": 384,
-                        "similarity": "cosine"
-                    }
-                }
-            }
-        }
-        
-        # In a real scenario, you'd use Atlas Search API to create this index
-        # Here we're just printing instructions for demonstration
-        print("For MongoDB Atlas, create a vector search index with the following configuration:")
-        print(vector_index)
-        
-        # Orderlines indexes
-        await db.db.orderlines.create_index([("orderNr", ASCENDING), ("productNr", ASCENDING)])
-        await db.db.orderlines.create_index("customerNr")
-        await db.db.orderlines.create_index("productNr")
-        
+    results = await asyncio.gather(
+        _build_product_indexes(),
+        _build_vector_search_index(),
+        _build_orderline_indexes(),
+        _ensure_product_pairs_collection(),
+        return_exceptions=True
+    )
+    
+    errors = [result for result in results if isinstance(result, Exception)]
+    for error in errors:
+        print(f"Error initializing database: {error}")
+    
+    if not errors:
         print("Database indexes initialized successfully")
-    except OperationFailure as e:
-        print(f"Error creating indexes: {e}")
-        # Continue anyway as this might be a permissions issue or the indexes already exist
     
+async def bulk_write_concurrent(collection, operations: list, chunk_size: int = BULK_WRITE_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Run an unordered bulk write as concurrent chunks over the connection pool.
+    
+    Returns a summary in the shape of BulkWriteError.details: nUpserted,
+    nMatched and nDeleted totals plus writeErrors, whose indexes refer to
+    positions in `operations`. Errors other than write errors are raised.
+    """
+    offsets = range(0, len(operations), chunk_size)
+    results = await asyncio.gather(
+        *(collection.bulk_write(operations[offset:offset + chunk_size], ordered=False) for offset in offsets),
+        return_exceptions=True
+    )
+    
+    summary = {"nUpserted": 0, "nMatched": 0, "nDeleted": 0, "writeErrors": []}
+    for offset, result in zip(offsets, results):
+        if isinstance(result, BulkWriteError):
+            # The rest of the chunk was still written
+            details = result.details
+            summary["nUpserted"] += details.get("nUpserted", 0)
+            summary["nMatched"] += details.get("nMatched", 0)
+            summary["nDeleted"] += details.get("nRemoved", 0)
+            summary["writeErrors"].extend(
+                {**error, "index": error["index"] + offset} for error in details.get("writeErrors", [])
+            )
+        elif isinstance(result, Exception):
+            raise result
+        else:
+            summary["nUpserted"] += result.upserted_count
+            summary["nMatched"] += result.matched_count
+            summary["nDeleted"] += result.deleted_count
+    
+    return summary
+
 async def get_db() -> Any:
     """Get the database instance, initializing if needed"""
     if not db.initialized:
-        db.initialize()
+        await db.initialize_async()
     return db.db
 
-async def get_product_collection():
+def bind_collections():
+    """
+    Cache the collection handles once the connection is initialized.
+    Called from the application lifespan, after which the handles never change.
+    """
+    global products_collection, orderlines_collection, product_pairs_collection
+    products_collection = db.db.products
+    orderlines_collection = db.db.orderlines
+    product_pairs_collection = db.db.product_pairs
+
+def get_product_collection():
     """Return the products collection"""
-    if not db.initialized:
-        db.initialize()
-    return db.db.products
+    return products_collection
 
-async def get_orderlines_collection():
+def get_orderlines_collection():
     """Return the orderlines collection"""
-    if not db.initialized:
-        db.initialize()
-    return db.db.orderlines
+    return orderlines_collection
 
-async def get_product_pairs_collection():
+def get_product_pairs_collection():
     """Return the product_pairs collection"""
-    if not db.initialized:
-        db.initialize()
-    return db.db.product_pairs
+    return product_pairs_collection
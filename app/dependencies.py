@@ -1,16 +1,21 @@
 from fastapi import Header, HTTPException, status
+import hmac
 import os
 
 API_KEY = os.getenv("API_KEY", "your_default_api_key")
+# Encoded once at import so each request only encodes the submitted key
+_API_KEY_BYTES = API_KEY.encode("utf-8")
 
 async def get_api_key(x_apikey: str = Header(...)):
     """
     Validate the API key sent in the x-apikey header.
     As per requirement Obj5, this is a simple shared secret validation.
+    The comparison is constant-time to avoid leaking the key through timing.
     """
-    if x_apikey != API_KEY:
+    if not hmac.compare_digest(x_apikey.encode("utf-8"), _API_KEY_BYTES):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key"
         )
     return x_apikey
+
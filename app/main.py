@@ -1,9 +1,8 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from motor.motor_asyncio import AsyncIOMotorClient
 from contextlib import asynccontextmanager
-import time
 
 import os
 from routers import products, orders, admin, naive_recommender, health, ingest
@@ -17,7 +16,7 @@ else:
     from routers import search
     print("Using production search implementation with MongoDB Atlas Search")
 from dependencies import get_api_key
-from database.mongodb import db
+from database.mongodb import db, bind_collections
 from services.monitoring import APIMonitoringMiddleware, SearchMetrics
 from services.benchmarking import performance_tracker
 
@@ -29,20 +28,16 @@ async def lifespan(app: FastAPI):
     
     # Initialize the database with our improved approach
     db.initialize(mongodb_uri)
+    bind_collections()
     
     # Store references in app state for middleware access
     app.mongodb_client = db.client
     app.mongodb = db.db
     
-    # Initialize vector search indices if needed
+    # Initialize indices and ensure required collections exist
     from database.mongodb import init_indexes
     await init_indexes()
     
-    # Ensure required collections exist
-    collections = await db.db.list_collection_names()
-    if "product_pairs" not in collections:
-        await db.db.create_collection("product_pairs")
-    
     print(f"Connected to MongoDB at {mongodb_uri}")
     yield
     # Cleanup
@@ -55,7 +50,8 @@ app = FastAPI(
     title="Product Search and Recommendation API",
     description="API for vector search and product recommendations using MongoDB Atlas",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -67,7 +63,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add monitoring middleware
+# Add monitoring middleware (also sets the X-Process-Time header on every response)
 app.add_middleware(APIMonitoringMiddleware)
 
 # Include routers
@@ -87,23 +83,22 @@ app.include_router(health.router)
 @app.get("/api-stats", tags=["Monitoring"], dependencies=[Depends(get_api_key)])
 async def api_stats():
     """Get API usage statistics and metrics"""
-    return {
+    return ORJSONResponse(content={
         "search_metrics": {
             "average_processing_time": SearchMetrics.get_average_processing_time(),
             "popular_queries": SearchMetrics.get_popular_queries(),
             "recent_searches": SearchMetrics.get_recent_searches(10)
         }
-    }
-
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    """Middleware to add processing time to all responses"""
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
+    })
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=False,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )
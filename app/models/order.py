@@ -1,6 +1,6 @@
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 
 class OrderLine(BaseModel):
     """
@@ -13,8 +13,8 @@ class OrderLine(BaseModel):
     seasonName: str
     dateTime: datetime
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "orderNr": "ORD12345",
                 "productNr": "prod1",
@@ -23,6 +23,7 @@ class OrderLine(BaseModel):
                 "dateTime": "2023-12-15T14:30:00"
             }
         }
+    )
 
 class RecommendationQuery(BaseModel):
     """
@@ -31,10 +32,26 @@ class RecommendationQuery(BaseModel):
     productId: str
     limit: int = 5
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "productId": "prod1",
                 "limit": 5
             }
         }
+    )
+
+
+class UserOrdersDeleteRequest(BaseModel):
+    """
+    Request model for deleting the orders of several users at once
+    """
+    user_ids: List[str] = Field(..., min_length=1)
+    
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "user_ids": ["cust789", "cust790"]
+            }
+        }
+    )
@@ -1,5 +1,10 @@
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+from utils.vectors import pack_embedding
+
+# Embedding fields on Product, filled in during ingestion rather than supplied by clients
+EMBEDDING_FIELDS = {"title_embedding", "description_embedding"}
 
 class Product(BaseModel):
     """
@@ -23,11 +28,20 @@ class Product(BaseModel):
     stockLevel: int = 0
     
     # Fields for vector search (populated during ingestion)
-    title_embedding: Optional[List[float]] = None
-    description_embedding: Optional[List[float]] = None
+    # Stored as packed float32 BSON vectors; lists of floats are packed on validation
+    title_embedding: Optional[bytes] = None
+    description_embedding: Optional[bytes] = None
+    
+    @field_validator("title_embedding", "description_embedding", mode="before")
+    @classmethod
+    def pack_embedding_vectors(cls, value):
+        """Pack embeddings given as lists of floats into float32 BSON vectors"""
+        if value is None or isinstance(value, bytes):
+            return value
+        return pack_embedding(value)
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "id": "prod1",
                 "title": "Baby Shoes",
@@ -47,13 +61,12 @@ class Product(BaseModel):
                 "stockLevel": 45
             }
         }
+    )
 
 class ProductInDB(Product):
     """
     Product model with additional database fields
     """
-    title_embedding: Optional[List[float]] = None
-    description_embedding: Optional[List[float]] = None
     _id: Optional[str] = None
 
 class ProductSearchQuery(BaseModel):
@@ -65,8 +78,8 @@ class ProductSearchQuery(BaseModel):
     limit: int = 10
     offset: int = 0
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "query": "red baby shoes",
                 "filters": {
@@ -78,6 +91,7 @@ class ProductSearchQuery(BaseModel):
                 "offset": 0
             }
         }
+    )
 
 class AutosuggestQuery(BaseModel):
     """
@@ -86,13 +100,14 @@ class AutosuggestQuery(BaseModel):
     prefix: str
     limit: int = 5
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "prefix": "bab",
                 "limit": 5
             }
         }
+    )
 
 class FacetResult(BaseModel):
     """
@@ -140,8 +155,8 @@ class ConsolidatedSearchRequest(BaseModel):
     maxProducts: int = 20
     includeVectorSearch: bool = True
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "query": "metaldetector",
                 "maxCategories": 5,
@@ -150,6 +165,7 @@ class ConsolidatedSearchRequest(BaseModel):
                 "includeVectorSearch": True
             }
         }
+    )
 
 
 class ConsolidatedSearchResponse(BaseModel):
@@ -2,14 +2,21 @@
 Administration router for MongoDB Atlas Search API
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Path
+from fastapi.responses import ORJSONResponse
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 import asyncio
+import bisect
+
+import numpy as np
+from pymongo import DeleteMany
 
 from services.monitoring import SearchMetrics
 from services.benchmarking import performance_tracker
-from services.cache import search_cache, product_cache, recommendations_cache
+from services.cache import search_cache, product_cache, recommendations_cache, embedding_cache
+from services.semantic_cache import semantic_search_cache
 from database.mongodb import get_product_collection, get_orderlines_collection, get_product_pairs_collection
+from models.order import UserOrdersDeleteRequest
 from dependencies import get_api_key
 
 router = APIRouter(
@@ -18,7 +25,11 @@ router = APIRouter(
     dependencies=[Depends(get_api_key)]
 )
 
-@router.get("/metrics", response_model=Dict[str, Any])
+# Health status labels keyed by the upper bound (exclusive) of their score range
+_STATUS_TABLE = [(50, "poor"), (75, "fair"), (90, "good"), (float("inf"), "excellent")]
+_STATUS_THRESHOLDS = [threshold for threshold, _ in _STATUS_TABLE]
+
+@router.get("/metrics", response_class=ORJSONResponse)
 async def get_metrics(
     time_window_minutes: Optional[int] = Query(60, description="Time window for metrics in minutes")
 ):
@@ -42,11 +53,13 @@ async def get_metrics(
     cache_stats = {
         "search_cache": search_cache.get_stats(),
         "product_cache": product_cache.get_stats(),
-        "recommendations_cache": recommendations_cache.get_stats()
+        "recommendations_cache": recommendations_cache.get_stats(),
+        "embedding_cache": embedding_cache.get_stats()
     }
     
     # Compile all metrics
-    return {
+    # Returned as ORJSONResponse directly to skip the jsonable_encoder pass
+    return ORJSONResponse(content={
         "timestamp": datetime.now().isoformat(),
         "time_window_minutes": time_window_minutes,
         "search_performance": search_stats,
@@ -57,7 +70,7 @@ async def get_metrics(
             "popular_queries": SearchMetrics.get_popular_queries(10),
             "avg_processing_time": SearchMetrics.get_average_processing_time(100)
         }
-    }
+    })
 
 
 @router.delete("/remove/product/{product_id}", response_model=Dict[str, Any])
@@ -71,7 +84,7 @@ async def delete_product(
     """
     try:
         # Get product collection
-        collection = await get_product_collection()
+        collection = get_product_collection()
         
         # Delete the product
         result = await collection.delete_one({"id": product_id})
@@ -85,8 +98,9 @@ async def delete_product(
         # Clear product from cache
         product_cache.remove(product_id)
         
-        # Invalidate related search caches since results may have included this product
-        search_cache.clear()
+        # Invalidate only the search cache entries whose results included this product
+        search_cache.invalidate_by_product(product_id)
+        semantic_search_cache.invalidate_by_product(product_id)
         
         return {
             "status": "success",
@@ -112,14 +126,11 @@ async def delete_all_products():
     """
     try:
         # Get collections
-        product_collection = await get_product_collection()
-        product_pairs_collection = await get_product_pairs_collection()
-        
-        # Count documents before deletion
-        product_count = await product_collection.count_documents({})
+        product_collection = get_product_collection()
+        product_pairs_collection = get_product_pairs_collection()
         
         # Delete all products
-        await product_collection.delete_many({})
+        result = await product_collection.delete_many({})
         
         # Delete all product pairs used for recommendations
         await product_pairs_collection.delete_many({})
@@ -127,12 +138,13 @@ async def delete_all_products():
         # Clear all caches
         product_cache.clear()
         search_cache.clear()
+        semantic_search_cache.clear()
         recommendations_cache.clear()
         
         return {
             "status": "success",
             "message": f"All products deleted successfully",
-            "deleted_count": product_count
+            "deleted_count": result.deleted_count
         }
     except Exception as e:
         raise HTTPException(
@@ -152,7 +164,7 @@ async def delete_order(
     """
     try:
         # Get orderlines collection
-        collection = await get_orderlines_collection()
+        collection = get_orderlines_collection()
         
         # Delete the orderlines for this order ID
         result = await collection.delete_many({"orderNr": order_id})
@@ -192,13 +204,10 @@ async def delete_all_orders():
     """
     try:
         # Get orderlines collection
-        collection = await get_orderlines_collection()
-        
-        # Count documents before deletion
-        order_count = await collection.count_documents({})
+        collection = get_orderlines_collection()
         
         # Delete all orderlines
-        await collection.delete_many({})
+        result = await collection.delete_many({})
         
         # Clear recommendations cache as it depends on order history
         recommendations_cache.clear()
@@ -206,7 +215,7 @@ async def delete_all_orders():
         return {
             "status": "success",
             "message": f"All orders deleted successfully",
-            "deleted_count": order_count
+            "deleted_count": result.deleted_count
         }
     except Exception as e:
         raise HTTPException(
@@ -227,20 +236,17 @@ async def delete_user_orders(
     """
     try:
         # Get orderlines collection
-        collection = await get_orderlines_collection()
+        collection = get_orderlines_collection()
         
-        # Count documents before deletion
-        user_order_count = await collection.count_documents({"customerNr": user_id})
+        # Delete all orderlines for this user
+        result = await collection.delete_many({"customerNr": user_id})
         
-        if user_order_count == 0:
+        if result.deleted_count == 0:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"User with ID {user_id} has no orders"
             )
         
-        # Delete all orderlines for this user
-        await collection.delete_many({"customerNr": user_id})
-        
         # Clear specific user's recommendations from cache
         # This is a simple approach - ideally we would only invalidate this user's cache entries
         recommendations_cache.clear()
@@ -248,7 +254,7 @@ async def delete_user_orders(
         return {
             "status": "success",
             "message": f"All orders for user {user_id} deleted successfully",
-            "deleted_count": user_order_count
+            "deleted_count": result.deleted_count
         }
     except Exception as e:
         if isinstance(e, HTTPException):
@@ -260,6 +266,37 @@ async def delete_user_orders(
             )
 
 
+@router.post("/remove/orders/users", response_model=Dict[str, Any])
+async def delete_users_orders(request: UserOrdersDeleteRequest):
+    """
+    Delete all orders for several users
+    
+    The per-user deletes are sent as one unordered bulk write, so the server
+    can apply them in parallel instead of one round trip per user.
+    """
+    try:
+        # Get orderlines collection
+        collection = get_orderlines_collection()
+        
+        # Delete all orderlines for these users in a single bulk write
+        operations = [DeleteMany({"customerNr": user_id}) for user_id in request.user_ids]
+        result = await collection.bulk_write(operations, ordered=False)
+        
+        # Clear recommendations cache as the order history has changed
+        recommendations_cache.clear()
+        
+        return {
+            "status": "success",
+            "message": f"Orders for {len(request.user_ids)} users deleted successfully",
+            "deleted_count": result.deleted_count
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to delete user orders: {str(e)}"
+        )
+
+
 @router.get("/cache/stats", response_model=Dict[str, Any])
 async def cache_stats():
     """
@@ -267,8 +304,10 @@ async def cache_stats():
     """
     return {
         "search_cache": search_cache.get_stats(),
+        "semantic_search_cache": semantic_search_cache.get_stats(),
         "product_cache": product_cache.get_stats(),
-        "recommendations_cache": recommendations_cache.get_stats()
+        "recommendations_cache": recommendations_cache.get_stats(),
+        "embedding_cache": embedding_cache.get_stats()
     }
 
 
@@ -279,6 +318,7 @@ async def clear_cache(cache_type: str):
     """
     if cache_type == "search":
         search_cache.clear()
+        semantic_search_cache.clear()
         return {"status": "success", "message": "Search cache cleared"}
     elif cache_type == "product":
         product_cache.clear()
@@ -286,19 +326,24 @@ async def clear_cache(cache_type: str):
     elif cache_type == "recommendations":
         recommendations_cache.clear()
         return {"status": "success", "message": "Recommendations cache cleared"}
+    elif cache_type == "embedding":
+        embedding_cache.clear()
+        return {"status": "success", "message": "Embedding cache cleared"}
     elif cache_type == "all":
         search_cache.clear()
+        semantic_search_cache.clear()
         product_cache.clear()
         recommendations_cache.clear()
+        embedding_cache.clear()
         return {"status": "success", "message": "All caches cleared"}
     else:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid cache type: {cache_type}. Valid types: search, product, recommendations, all"
+            detail=f"Invalid cache type: {cache_type}. Valid types: search, product, recommendations, embedding, all"
         )
 
 
-@router.get("/performance/summary", response_model=Dict[str, Any])
+@router.get("/performance/summary", response_class=ORJSONResponse)
 async def performance_summary():
     """
     Get a high-level performance summary of the API
@@ -324,29 +369,25 @@ async def performance_summary():
         penalty = min(30, (last_hour["p95_duration_ms"] - 500) / 20)
         health_score -= penalty
     
-    # Penalize for low success rates in endpoints
-    for endpoint, stats in endpoint_stats.items():
-        if stats["success_rate"] < 0.99:  # < 99% success rate is concerning
-            penalty = min(20, (0.99 - stats["success_rate"]) * 100)
-            health_score -= penalty
+    # Penalize for low success rates in endpoints (< 99% success rate is concerning),
+    # capped at 20 points per endpoint
+    success_rates = np.fromiter(
+        (stats["success_rate"] for stats in endpoint_stats.values()),
+        dtype=np.float64,
+        count=len(endpoint_stats)
+    )
+    health_score -= float(np.clip((0.99 - success_rates) * 100.0, 0.0, 20.0).sum())
     
     # Round and cap the health score
     health_score = max(0, min(100, round(health_score, 1)))
     
     # Determine status based on health score
-    if health_score >= 90:
-        status = "excellent"
-    elif health_score >= 75:
-        status = "good"
-    elif health_score >= 50:
-        status = "fair"
-    else:
-        status = "poor"
+    status_label = _STATUS_TABLE[bisect.bisect_right(_STATUS_THRESHOLDS, health_score)][1]
     
-    return {
+    return ORJSONResponse(content={
         "timestamp": datetime.now().isoformat(),
         "health_score": health_score,
-        "status": status,
+        "status": status_label,
         "performance_summary": {
             "last_hour": {
                 "search_avg_ms": last_hour["avg_duration_ms"],
@@ -369,4 +410,4 @@ async def performance_summary():
                 stats["count"] for _, stats in performance_tracker.get_recommendation_stats().items()
             )
         }
-    }
+    })
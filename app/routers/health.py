@@ -2,11 +2,27 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from typing import Dict, Any
 import time
 import os
+import asyncio
 
 from database.mongodb import get_db
 
 router = APIRouter(tags=["health"])
 
+async def _coll_size_count(db, name: str):
+    """
+    Get the document count and data size of a collection.
+    Uses a $collStats aggregation that projects only the two fields the
+    health check reports instead of the full collStats command output.
+    """
+    pipeline = [
+        {"$collStats": {"storageStats": {"scale": 1}}},
+        {"$project": {"_id": 0, "count": "$storageStats.count", "size": "$storageStats.size"}}
+    ]
+    results = await db[name].aggregate(pipeline).to_list(1)
+    if not results:
+        return 0, 0
+    return results[0].get("count", 0), results[0].get("size", 0)
+
 @router.get("/health", response_model=Dict[str, Any])
 async def health_check():
     """
@@ -29,34 +45,29 @@ async def health_check():
         await db.command("ping")
         health_info["database_connection"] = "ok"
         
-        # Get collection stats
-        try:
-            products_stats = await db.command("collStats", "products")
-            orderlines_stats = await db.command("collStats", "orderlines")
-            product_pairs_stats = await db.command("collStats", "product_pairs")
-            
+        # Get collection stats concurrently
+        collection_names = ["products", "orderlines", "product_pairs"]
+        stats_results = await asyncio.gather(
+            *(_coll_size_count(db, name) for name in collection_names),
+            return_exceptions=True
+        )
+        
+        if any(isinstance(stats, Exception) for stats in stats_results):
+            # Collection stats are not critical for health check
             health_info["services"]["mongodb"] = {
                 "status": "healthy",
-                "collections": {
-                    "products": {
-                        "count": products_stats.get("count", 0),
-                        "size_mb": round(products_stats.get("size", 0) / (1024 * 1024), 2)
-                    },
-                    "orderlines": {
-                        "count": orderlines_stats.get("count", 0),
-                        "size_mb": round(orderlines_stats.get("size", 0) / (1024 * 1024), 2)
-                    },
-                    "product_pairs": {
-                        "count": product_pairs_stats.get("count", 0),
-                        "size_mb": round(product_pairs_stats.get("size", 0) / (1024 * 1024), 2)
-                    }
-                }
+                "collections_stats": "unavailable"
             }
-        except Exception as e:
-            # Collection stats are not critical for health check
+        else:
             health_info["services"]["mongodb"] = {
                 "status": "healthy",
-                "collections_stats": "unavailable"
+                "collections": {
+                    name: {
+                        "count": count,
+                        "size_mb": round(size / (1024 * 1024), 2)
+                    }
+                    for name, (count, size) in zip(collection_names, stats_results)
+                }
             }
             
     except Exception as e:
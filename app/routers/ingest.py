@@ -3,13 +3,20 @@ Ingestion API for MongoDB Atlas Search
 Handles ingestion of products and orderlines with embedding generation
 """
 from fastapi import APIRouter, HTTPException, status, Body, Depends, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
 from typing import List, Dict, Any, Optional
 import time
+import asyncio
 
-from models.product import Product, ProductInDB
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from models.product import Product, ProductInDB, EMBEDDING_FIELDS
 from models.order import OrderLine
-from database.mongodb import get_product_collection, get_orderlines_collection
+from database.mongodb import get_product_collection, get_orderlines_collection, bulk_write_concurrent
 from services.embedding import embedding_service
+from utils.vectors import pack_embedding
 from dependencies import get_api_key
 
 router = APIRouter(
@@ -18,6 +25,62 @@ router = APIRouter(
     dependencies=[Depends(get_api_key)]
 )
 
+async def upsert_products(collection, products: List[Product]) -> Dict[str, Any]:
+    """
+    Generate embeddings for products and upsert them into the products collection.
+    Shared by /ingest/products and /ingestProducts.
+    
+    Returns the inserted and updated counts, the IDs of the products written
+    and the per-product write errors. Writes are unordered, so a failed product
+    does not abort the rest of the batch; callers must check the errors.
+    """
+    inserted_count = 0
+    updated_count = 0
+    
+    # Keep only the last occurrence of each product ID. Upserts run unordered and
+    # in concurrent chunks, so duplicates in one payload would race on the unique id index.
+    products = list({product.id: product for product in products}.values())
+    
+    if not products:
+        return {"inserted": 0, "updated": 0, "ingested_ids": [], "errors": []}
+    
+    # Generate all title and description embeddings in one batched call
+    embeddings = await embedding_service.generate_embeddings_async(
+        [product.title for product in products] + [product.description for product in products]
+    )
+    title_embeddings = embeddings[:len(products)]
+    description_embeddings = embeddings[len(products):]
+    
+    # Build one upsert per product
+    operations = []
+    for product, title_embedding, description_embedding in zip(products, title_embeddings, description_embeddings):
+        # Create product document
+        product_dict = product.model_dump(exclude=EMBEDDING_FIELDS)
+        product_dict["title_embedding"] = pack_embedding(title_embedding)
+        product_dict["description_embedding"] = pack_embedding(description_embedding)
+        operations.append(ReplaceOne({"id": product.id}, product_dict, upsert=True))
+    
+    # Insert or update all products with unordered bulk writes, run concurrently in chunks
+    summary = await bulk_write_concurrent(collection, operations)
+    inserted_count = summary["nUpserted"]
+    updated_count = summary["nMatched"]
+    
+    # Log failed products; the rest of the batch is still written
+    failed_indexes = set()
+    errors = []
+    for error in summary["writeErrors"]:
+        failed_indexes.add(error["index"])
+        product_id = products[error["index"]].id
+        errors.append({"id": product_id, "error": error.get("errmsg")})
+        print(f"Error ingesting product {product_id}: {error.get('errmsg')}")
+    
+    return {
+        "inserted": inserted_count,
+        "updated": updated_count,
+        "ingested_ids": [product.id for i, product in enumerate(products) if i not in failed_indexes],
+        "errors": errors
+    }
+
 @router.post("/products", status_code=status.HTTP_201_CREATED)
 async def ingest_products(request: Request, products: List[Product] = Body(...)):
     """
@@ -28,50 +91,20 @@ async def ingest_products(request: Request, products: List[Product] = Body(...))
     - Stores products with embeddings in MongoDB
     """
     start_time = time.time()
-    collection = await get_product_collection()
+    collection = get_product_collection()
     
     # Process products with embedding generation
-    inserted_count = 0
-    updated_count = 0
-    
-    for product in products:
-        # Generate embeddings
-        title_embedding = embedding_service.generate_embedding(product.title)
-        description_embedding = embedding_service.generate_embedding(product.description)
-        
-        # Create product document
-        product_dict = product.dict()
-        product_dict["title_embedding"] = title_embedding
-        product_dict["description_embedding"] = description_embedding
-        
-        # Insert or update product
-        try:
-            # Check if product already exists
-            existing = await collection.find_one({"id": product.id})
-            
-            if existing:
-                # Update existing product
-                await collection.replace_one(
-                    {"id": product.id},
-                    product_dict
-                )
-                updated_count += 1
-            else:
-                # Insert new product
-                await collection.insert_one(product_dict)
-                inserted_count += 1
-                
-        except Exception as e:
-            # Log error and continue with next product
-            print(f"Error ingesting product {product.id}: {str(e)}")
+    result = await upsert_products(collection, products)
     
     processing_time = time.time() - start_time
     request.state.processing_time = processing_time
     
     return {
         "status": "success",
-        "inserted": inserted_count,
-        "updated": updated_count,
+        "inserted": result["inserted"],
+        "updated": result["updated"],
+        "failed": len(result["errors"]),
+        "errors": result["errors"],
         "total_processed": len(products),
         "processing_time_ms": round(processing_time * 1000, 2)
     }
@@ -86,20 +119,31 @@ async def ingest_orderlines(request: Request, orderlines: List[OrderLine] = Body
     - Updates product relationship data for recommendations
     """
     start_time = time.time()
-    collection = await get_orderlines_collection()
+    collection = get_orderlines_collection()
     
     # Process orderlines
     inserted_count = 0
+    errors = []
     
-    for orderline in orderlines:
-        # Insert orderline
+    # Insert all orderlines in a single unordered batch
+    if orderlines:
         try:
-            await collection.insert_one(orderline.dict())
-            inserted_count += 1
-            
-        except Exception as e:
-            # Log error and continue with next orderline
-            print(f"Error ingesting orderline {orderline.orderNr}/{orderline.productNr}: {str(e)}")
+            result = await collection.insert_many(
+                [orderline.model_dump() for orderline in orderlines],
+                ordered=False
+            )
+            inserted_count = len(result.inserted_ids)
+        except BulkWriteError as e:
+            # Log failed orderlines; the rest of the batch is still inserted
+            inserted_count = e.details.get("nInserted", 0)
+            for error in e.details.get("writeErrors", []):
+                orderline = orderlines[error["index"]]
+                errors.append({
+                    "orderNr": orderline.orderNr,
+                    "productNr": orderline.productNr,
+                    "error": error.get("errmsg")
+                })
+                print(f"Error ingesting orderline {orderline.orderNr}/{orderline.productNr}: {error.get('errmsg')}")
     
     # Optionally trigger recommendation pre-computation
     # This would be a background task in a real implementation
@@ -110,10 +154,29 @@ async def ingest_orderlines(request: Request, orderlines: List[OrderLine] = Body
     return {
         "status": "success",
         "inserted": inserted_count,
+        "failed": len(errors),
+        "errors": errors,
         "total_processed": len(orderlines),
         "processing_time_ms": round(processing_time * 1000, 2)
     }
 
+# Validators for the sections of a batch-import payload
+_PRODUCTS_ADAPTER = TypeAdapter(List[Product])
+_ORDERLINES_ADAPTER = TypeAdapter(List[OrderLine])
+
+def _validate_section(adapter: TypeAdapter, data: Dict[str, Any], key: str) -> List[Any]:
+    """
+    Validate one section of the raw batch-import payload.
+    Errors are raised as a RequestValidationError, so they get the same 422
+    response as any other invalid request body.
+    """
+    try:
+        return adapter.validate_python(data[key])
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", key, *error["loc"])} for error in e.errors(include_url=False)]
+        )
+
 @router.post("/batch-import")
 async def batch_import(request: Request, data: Dict[str, Any] = Body(...)):
     """
@@ -124,22 +187,41 @@ async def batch_import(request: Request, data: Dict[str, Any] = Body(...)):
     - Returns counts of inserted/updated items
     """
     results = {
-        "products": {"processed": 0, "inserted": 0, "updated": 0},
-        "orderlines": {"processed": 0, "inserted": 0}
+        "products": {"processed": 0, "inserted": 0, "updated": 0, "failed": 0},
+        "orderlines": {"processed": 0, "inserted": 0, "failed": 0}
     }
     
+    has_products = "products" in data and isinstance(data["products"], list)
+    has_orderlines = "orderlines" in data and isinstance(data["orderlines"], list)
+    
+    # The raw payload bypasses request validation, so build the models here.
+    # Both sections are validated before either is written.
+    products = _validate_section(_PRODUCTS_ADAPTER, data, "products") if has_products else None
+    orderlines = _validate_section(_ORDERLINES_ADAPTER, data, "orderlines") if has_orderlines else None
+    
+    tasks = {}
+    if products is not None:
+        tasks["products"] = ingest_products(request, products=products)
+    if orderlines is not None:
+        tasks["orderlines"] = ingest_orderlines(request, orderlines=orderlines)
+    
+    # Products and orderlines go to different collections, so ingest them concurrently
+    outcomes = dict(zip(tasks, await asyncio.gather(*tasks.values())))
+    
     # Process products if provided
-    if "products" in data and isinstance(data["products"], list):
-        products_result = await ingest_products(request, products=data["products"])
+    if "products" in outcomes:
+        products_result = outcomes["products"]
         results["products"]["processed"] = products_result["total_processed"]
         results["products"]["inserted"] = products_result["inserted"]
         results["products"]["updated"] = products_result["updated"]
+        results["products"]["failed"] = products_result["failed"]
     
     # Process orderlines if provided
-    if "orderlines" in data and isinstance(data["orderlines"], list):
-        orderlines_result = await ingest_orderlines(request, orderlines=data["orderlines"])
+    if "orderlines" in outcomes:
+        orderlines_result = outcomes["orderlines"]
         results["orderlines"]["processed"] = orderlines_result["total_processed"]
         results["orderlines"]["inserted"] = orderlines_result["inserted"]
+        results["orderlines"]["failed"] = orderlines_result["failed"]
     
     return {
         "status": "success",
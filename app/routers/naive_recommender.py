@@ -38,7 +38,8 @@ async def get_product_pairs_status():
     """
     Get status of product pairs computation
     """
-    count = await db.db.product_pairs.count_documents({})
+    # Unfiltered count from collection metadata, without scanning the pairs
+    count = await db.db.product_pairs.estimated_document_count()
     return {
         "status": "Ready" if count > 0 else "Not computed",
         "product_pairs_count": count
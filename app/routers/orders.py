@@ -4,7 +4,7 @@ import time
 
 from models.order import OrderLine, RecommendationQuery
 from models.product import Product
-from database.mongodb import get_orderlines_collection, get_product_collection
+from database.mongodb import get_orderlines_collection, get_product_collection, NO_EMBEDDING_PROJECTION
 from services.recommendations import RecommendationEngine
 from services.cache import recommendations_cache
 
@@ -15,10 +15,10 @@ async def ingest_orderline(orderline: OrderLine = Body(...)):
     """
     Ingests orderline data for use in product recommendations
     """
-    collection = await get_orderlines_collection()
+    collection = get_orderlines_collection()
     
     # Convert to dict and insert
-    orderline_dict = orderline.dict()
+    orderline_dict = orderline.model_dump()
     
     # Convert datetime to string for MongoDB storage
     if isinstance(orderline_dict["dateTime"], str):
@@ -52,8 +52,8 @@ async def similar_products(
         query = RecommendationQuery(productId=product_id)
 
     # Get collections
-    product_collection = await get_product_collection()
-    orderlines_collection = await get_orderlines_collection()
+    product_collection = get_product_collection()
+    orderlines_collection = get_orderlines_collection()
     
     # Select recommendation algorithm based on input parameter
     try:
@@ -79,44 +79,42 @@ async def similar_products(
         print(f"Recommendation engine error: {str(e)}. Using fallback method.")
         
         # Check if the product exists
-        product = await product_collection.find_one({"id": product_id})
+        product = await product_collection.find_one({"id": product_id}, {"_id": 1})
         if not product:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Product with ID {product_id} not found"
             )
             
-        # Simplified fallback implementation
-        orders_with_product = await orderlines_collection.find(
-            {"productNr": product_id}
-        ).distinct("orderNr")
-        
-        if not orders_with_product:
-            # If no orders found, return empty list
-            return []
-            
+        # Simplified fallback implementation: co-occurrence counts and product details
+        # are joined on the server in a single aggregation
         pipeline = [
-            {"$match": {"orderNr": {"$in": orders_with_product}, "productNr": {"$ne": product_id}}},
-            {"$group": {"_id": "$productNr", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-            {"$limit": query.limit}
+            # Orders containing the product
+            {"$match": {"productNr": product_id}},
+            {"$group": {"_id": "$orderNr"}},
+            # Other products bought in those orders
+            {"$lookup": {
+                "from": "orderlines",
+                "localField": "_id",
+                "foreignField": "orderNr",
+                "as": "siblings"
+            }},
+            {"$unwind": "$siblings"},
+            {"$match": {"siblings.productNr": {"$ne": product_id}}},
+            {"$sortByCount": "$siblings.productNr"},
+            {"$limit": query.limit},
+            # Product details for the recommended products
+            {"$lookup": {
+                "from": "products",
+                "localField": "_id",
+                "foreignField": "id",
+                "as": "product"
+            }},
+            {"$unwind": "$product"},
+            {"$replaceRoot": {"newRoot": "$product"}},
+            {"$project": NO_EMBEDDING_PROJECTION}
         ]
         
-        similar_products_cursor = orderlines_collection.aggregate(pipeline)
-        similar_product_ids = [item["_id"] async for item in similar_products_cursor]
-        
-        # Fetch product details for the recommended products
-        recommended_products = []
-        if similar_product_ids:
-            cursor = product_collection.find({"id": {"$in": similar_product_ids}})
-            async for product in cursor:
-                # Remove MongoDB _id and embedding vectors from response
-                if "_id" in product:
-                    del product["_id"]
-                if "title_embedding" in product:
-                    del product["title_embedding"]
-                if "description_embedding" in product:
-                    del product["description_embedding"]
-                recommended_products.append(product)
+        recommended_products = await orderlines_collection.aggregate(pipeline).to_list(query.limit)
     
     return recommended_products
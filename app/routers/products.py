@@ -2,8 +2,8 @@ from fastapi import APIRouter, HTTPException, status, Body
 from typing import List, Optional
 
 from models.product import Product, ProductInDB
-from database.mongodb import get_product_collection
-from services.embedding import embedding_service
+from database.mongodb import get_product_collection, NO_EMBEDDING_PROJECTION
+from routers.ingest import upsert_products
 
 router = APIRouter()
 
@@ -15,44 +15,17 @@ async def ingest_products(products: List[Product] = Body(...)):
     
     Returns the IDs of the ingested products.
     """
-    # Get the product collection
-    collection = await get_product_collection()
-    ingested_ids = []
-    
-    # Process each product
-    for product in products:
-        try:
-            # Generate embeddings for title and description
-            title_embedding = embedding_service.generate_embedding(product.title)
-            description_embedding = embedding_service.generate_embedding(product.description)
-            
-            # Create product with embeddings
-            product_dict = product.dict()
-            product_dict["title_embedding"] = title_embedding
-            product_dict["description_embedding"] = description_embedding
-            
-            # Upsert product (insert or update)
-            result = await collection.replace_one(
-                {"id": product.id}, 
-                product_dict, 
-                upsert=True
-            )
-            
-            ingested_ids.append(product.id)
-            
-        except Exception as e:
-            # Log but continue processing other products
-            print(f"Error ingesting product {product.id}: {str(e)}")
-    
-    return ingested_ids
+    # Same code path as /ingest/products: batched embeddings and bulk upserts
+    result = await upsert_products(get_product_collection(), products)
+    return result["ingested_ids"]
 
 @router.get("/doc/{product_id}", response_model=Product)
 async def get_product(product_id: str):
     """
     Retrieve full document by product ID
     """
-    collection = await get_product_collection()
-    product = await collection.find_one({"id": product_id})
+    collection = get_product_collection()
+    product = await collection.find_one({"id": product_id}, NO_EMBEDDING_PROJECTION)
     
     if not product:
         raise HTTPException(
@@ -60,10 +33,6 @@ async def get_product(product_id: str):
             detail=f"Product with ID {product_id} not found"
         )
     
-    # Convert MongoDB _id to string and remove it from response
-    if "_id" in product:
-        del product["_id"]
-    
     return product
 
 @router.delete("/remove/product/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -71,7 +40,7 @@ async def remove_product(product_id: str):
     """
     Remove a specific product by ID
     """
-    collection = await get_product_collection()
+    collection = get_product_collection()
     result = await collection.delete_one({"id": product_id})
     
     if result.deleted_count == 0:
@@ -87,6 +56,6 @@ async def remove_all_products():
     """
     Remove all products from the database
     """
-    collection = await get_product_collection()
+    collection = get_product_collection()
     await collection.delete_many({})
     return None
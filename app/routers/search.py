@@ -1,7 +1,7 @@
-from fastapi import APIRouter, HTTPException, status, Body, Request
-from fastapi import APIRouter, HTTPException, status, Body, Request
+from fastapi import APIRouter, HTTPException, status, Body, Request, Query, Response
 from typing import List, Dict, Any, Optional
-import json
+import orjson
+import re
 import time
 import asyncio
 
@@ -11,87 +11,169 @@ from models.product import (
     CategoryResult, BrandResult
 )
 from models.order import RecommendationQuery
-from database.mongodb import get_product_collection, get_database
-from services.embedding import embedding_service
+from database.mongodb import (
+    get_product_collection, NO_EMBEDDING_PROJECTION, VECTOR_INDEX_NAME, CASE_INSENSITIVE_COLLATION
+)
+from services.embedding import embedding_service, normalize_query, EMBEDDING_DIMENSIONS
 from services.cache import search_cache, product_cache, recommendations_cache
+from services.semantic_cache import semantic_search_cache
 from services.monitoring import SearchMetrics
 
 router = APIRouter()
 
+# Number of candidates each /search branch contributes to the fused ranking
+SEARCH_CANDIDATES = 100
+# $vectorSearch examines this many candidates per requested result (at most 10000)
+NUM_CANDIDATES_FACTOR = 20
+MAX_NUM_CANDIDATES = 10000
+# Rank constant of reciprocal rank fusion: a document at rank r scores weight / (r + RRF_K)
+RRF_K = 60
+
+# Query-independent parts of the /search pipeline, built once at import.
+# Requests only add the query text and embedding; these objects are never mutated.
+_TITLE_VECTOR = {"index": VECTOR_INDEX_NAME, "path": "title_embedding"}
+_DESCRIPTION_VECTOR = {"index": VECTOR_INDEX_NAME, "path": "description_embedding"}
+_TEXT_MATCH = {"path": ["title", "description", "brand"]}
+# Branch weights in the fused ranking
+_TITLE_VECTOR_WEIGHT = 1.5  # Higher weight on title matches
+_DESCRIPTION_VECTOR_WEIGHT = 1.0
+_TEXT_WEIGHT = 2.0  # Higher weight on text matches
+# Sums the branch scores of each product and orders products by the fused score
+_RRF_FUSE_STAGES = [
+    {"$group": {"_id": "$id", "doc": {"$mergeObjects": "$$ROOT"}, "_rrf": {"$sum": "$_rrf"}}},
+    {"$sort": {"_rrf": -1, "_id": 1}},
+    {"$replaceRoot": {"newRoot": {"$mergeObjects": ["$doc", {"_rrf": "$_rrf"}]}}}
+]
+
+def rrf_rank_stages(weight: float) -> List[Dict[str, Any]]:
+    """
+    Stages that give each document of a ranked branch its reciprocal rank
+    fusion score in an _rrf field. Embeddings are dropped first so only the
+    returned fields are buffered while ranking.
+    """
+    return [
+        {"$project": NO_EMBEDDING_PROJECTION},
+        {"$group": {"_id": None, "docs": {"$push": "$$ROOT"}}},
+        {"$unwind": {"path": "$docs", "includeArrayIndex": "rank"}},
+        {"$replaceRoot": {"newRoot": {"$mergeObjects": [
+            "$docs",
+            {"_rrf": {"$divide": [weight, {"$add": ["$rank", RRF_K]}]}}
+        ]}}}
+    ]
+
+def vector_search_stage(options: Dict[str, Any], query_embedding: List[float], limit: int) -> Dict[str, Any]:
+    """Build a $vectorSearch stage returning the top limit products"""
+    return {
+        "$vectorSearch": {
+            **options,
+            "queryVector": query_embedding,
+            "numCandidates": min(limit * NUM_CANDIDATES_FACTOR, MAX_NUM_CANDIDATES),
+            "limit": limit
+        }
+    }
+
+# Fields returned as facet counts by /search
+FACET_FIELDS = ["brand", "color", "ageBucket", "isOnSale", "seasons"]
+# Array-valued facet fields, counted per element rather than per array
+ARRAY_FACET_FIELDS = {"seasons"}
+_FACET_COUNT_BRANCHES = {
+    f"{facet_field}_values": (
+        [{"$unwind": f"${facet_field}"}] if facet_field in ARRAY_FACET_FIELDS else []
+    ) + [
+        {"$sortByCount": f"${facet_field}"},
+        {"$limit": 10}
+    ]
+    for facet_field in FACET_FIELDS
+}
+
+# Static parts of the /autosuggest pipeline
+_AUTOSUGGEST_FUZZY = {"maxEdits": 1}  # Allow 1 typo
+_AUTOSUGGEST_PROJECTION = {"$project": {"_id": 0, "id": 1, "title": 1, "brand": 1}}
+
 @router.post("/search", response_model=SearchResult)
 async def search_products(request: Request, query: ProductSearchQuery = Body(...)):
     """
     Main search endpoint that combines keyword and vector search to return ranked results.
     Supports faceted search results for filtering.
     """
-    collection = await get_product_collection()
+    # Check cache first; repeated searches skip the embedding and the Atlas round trip
+    cache_key = {
+        "endpoint": "search",
+        "query": normalize_query(query.query),
+        "filters": query.filters,
+        "offset": query.offset,
+        "limit": query.limit
+    }
+    cached_result = search_cache.get(cache_key)
+    if cached_result:
+        # Cached responses are already encoded JSON
+        return Response(content=cached_result, media_type="application/json")
+    
+    # Start timing for performance monitoring
+    start_time = time.time()
+    
+    collection = get_product_collection()
     
     # Generate embedding for the query
-    query_embedding = embedding_service.generate_embedding(query.query)
+    query_embedding = await embedding_service.embed_query(query.query)
     
-    # Build MongoDB Atlas search pipeline
-    # This includes vector search combined with keyword matching
-    pipeline = []
+    # Reuse the response of a near-identical earlier query with the same filters and paging
+    semantic_context = {key: value for key, value in cache_key.items() if key != "query"}
+    cached_result = semantic_search_cache.lookup(query_embedding, semantic_context)
+    if cached_result:
+        payload, product_ids = cached_result
+        search_cache.set(cache_key, payload, product_ids=product_ids)
+        return Response(content=payload, media_type="application/json")
     
-    # Create a $search stage for MongoDB Atlas Search
-    search_stage = {
-        "$search": {
-            "index": "product_search",  # This would be the name of your Atlas Search index
-            "compound": {
-                "should": [
-                    # Vector search on title embeddings
-                    {
-                        "knnBeta": {
-                            "vector": query_embedding,
-                            "path": "title_embedding",
-                            "k": 100,
-                            "score": {"boost": {"value": 1.5}}  # Higher weight on title matches
-                        }
-                    },
-                    # Vector search on description embeddings
-                    {
-                        "knnBeta": {
-                            "vector": query_embedding,
-                            "path": "description_embedding",
-                            "k": 100,
-                            "score": {"boost": {"value": 1.0}}
-                        }
-                    },
+    # Build MongoDB Atlas search pipeline
+    # Vector search on the title and description embeddings and keyword search
+    # each rank their own candidates, and the rankings are combined with
+    # reciprocal rank fusion
+    candidates = max(SEARCH_CANDIDATES, query.offset + query.limit)
+    text_operator = {"text": {**_TEXT_MATCH, "query": query.query}}
+    pipeline = [
+        vector_search_stage(_TITLE_VECTOR, query_embedding, candidates),
+        *rrf_rank_stages(_TITLE_VECTOR_WEIGHT),
+        {
+            "$unionWith": {
+                "coll": collection.name,
+                "pipeline": [
+                    vector_search_stage(_DESCRIPTION_VECTOR, query_embedding, candidates),
+                    *rrf_rank_stages(_DESCRIPTION_VECTOR_WEIGHT)
+                ]
+            }
+        },
+        {
+            "$unionWith": {
+                "coll": collection.name,
+                "pipeline": [
                     # Text search for exact and close matches
-                    {
-                        "text": {
-                            "query": query.query,
-                            "path": ["title", "description", "brand"],
-                            "score": {"boost": {"value": 2.0}}  # Higher weight on text matches
-                        }
-                    }
+                    {"$search": {"index": "product_search", **text_operator}},
+                    {"$limit": candidates},
+                    *rrf_rank_stages(_TEXT_WEIGHT)
                 ]
-            },
-            "returnStoredSource": True,
-            "facets": {
-                # Define facets for filtering results
-                "brand": {"type": "string", "path": "brand"},
-                "color": {"type": "string", "path": "color"},
-                "ageBucket": {"type": "string", "path": "ageBucket"},
-                "isOnSale": {"type": "boolean", "path": "isOnSale"},
-                "seasons": {"type": "string", "path": "seasons"}
             }
-        }
-    }
-    
-    pipeline.append(search_stage)
+        },
+        *_RRF_FUSE_STAGES
+    ]
     
     # Add filter stage if filters are provided
     if query.filters:
-        filter_conditions = {}
-        for key, value in query.filters.items():
-            filter_conditions[key] = value
-        
-        pipeline.append({"$match": filter_conditions})
-    
-    # Add pagination
-    pipeline.append({"$skip": query.offset})
-    pipeline.append({"$limit": query.limit})
+        pipeline.append({"$match": query.filters})
+    
+    # Page of results, total count and facet counts all come from one $facet stage
+    # over the fused and filtered candidates, so every facet reflects the filters
+    # and the searches run once for all of them
+    facet_stage = {
+        "results": [
+            {"$skip": query.offset},
+            {"$limit": query.limit},
+            {"$project": {"_rrf": 0}}
+        ],
+        "total": [{"$count": "count"}],
+        **_FACET_COUNT_BRANCHES
+    }
+    pipeline.append({"$facet": facet_stage})
     
     # Execute the search pipeline
     search_results = []
@@ -99,48 +181,26 @@ async def search_products(request: Request, query: ProductSearchQuery = Body(...
     total_count = 0
     
     try:
-        # Extract facets and results from the search response
-        cursor = collection.aggregate(pipeline)
-        
-        # Process results
-        async for doc in cursor:
-            # Remove MongoDB _id and embedding vectors from response
-            if "_id" in doc:
-                del doc["_id"]
-            if "title_embedding" in doc:
-                del doc["title_embedding"]
-            if "description_embedding" in doc:
-                del doc["description_embedding"]
-            
-            search_results.append(doc)
-            
-        # Since Atlas Search facets are not easily simulated in this example,
-        # we'll add a separate aggregation to get facet counts
-        facet_pipeline = []
-        for facet_field in ["brand", "color", "ageBucket", "isOnSale", "seasons"]:
-            facet_group = {
-                f"{facet_field}_values": [
-                    {"$unwind": {"path": f"${facet_field}", "preserveNullAndEmptyArrays": True}},
-                    {"$group": {"_id": f"${facet_field}", "count": {"$sum": 1}}},
-                    {"$sort": {"count": -1}},
-                    {"$limit": 10}
-                ]
-            }
-            facet_pipeline.append({"$facet": facet_group})
+        facet_results = await collection.aggregate(pipeline).to_list(1)
         
-        # Get facet counts
-        facet_results = await collection.aggregate(facet_pipeline).to_list(1)
         if facet_results:
             facet_result = facet_results[0]
+            
+            # Results arrive without _id, embedding vectors and fusion scores
+            search_results = facet_result.pop("results")
+            
+            # Count of fused candidates that pass the filters. Each search branch
+            # contributes at most `candidates` products, so this is capped at about
+            # three times that rather than being the full number of matches
+            total = facet_result.pop("total")
+            total_count = total[0]["count"] if total else 0
+            
             for field, values in facet_result.items():
                 # Strip _values suffix from field name
                 field_name = field.replace("_values", "")
                 facet = FacetResult(field=field_name, values=[{"value": item["_id"], "count": item["count"]} for item in values])
                 facets.append(facet)
         
-        # Get total count
-        total_count = len(search_results)
-        
     except Exception as e:
         print(f"Search error: {str(e)}")
         raise HTTPException(
@@ -167,12 +227,17 @@ async def search_products(request: Request, query: ProductSearchQuery = Body(...
         processing_time=processing_time
     )
     
-    # Cache the result
-    search_cache.set(cache_key, response.dict())
+    # Cache the encoded response; hits return the bytes without re-encoding.
+    # The response was validated when SearchResult was built, so encode it
+    # directly instead of letting FastAPI validate and encode it again
+    payload = orjson.dumps(response.model_dump())
+    product_ids = [product.get("id") for product in search_results]
+    search_cache.set(cache_key, payload, product_ids=product_ids)
+    semantic_search_cache.store(query_embedding, (payload, product_ids), semantic_context, product_ids=product_ids)
     
     request.state.processing_time = processing_time
     
-    return response
+    return Response(content=payload, media_type="application/json")
 
 @router.post("/autosuggest", response_model=List[Dict[str, Any]])
 async def autosuggest(request: Request, query: AutosuggestQuery = Body(...)):
@@ -180,7 +245,14 @@ async def autosuggest(request: Request, query: AutosuggestQuery = Body(...)):
     Lighter variant of search, optimized for prefix or partial matches.
     Provides fast autocomplete suggestions.
     """
-    collection = await get_product_collection()
+    # Check cache first
+    cache_key = {"endpoint": "autosuggest", "prefix": query.prefix, "limit": query.limit}
+    cached_result = search_cache.get(cache_key)
+    
+    if cached_result:
+        return Response(content=cached_result, media_type="application/json")
+    
+    collection = get_product_collection()
     
     # Build autocomplete query
     pipeline = [
@@ -190,49 +262,33 @@ async def autosuggest(request: Request, query: AutosuggestQuery = Body(...)):
                 "autocomplete": {
                     "query": query.prefix,
                     "path": "title",  # Search in title field
-                    "fuzzy": {
-                        "maxEdits": 1  # Allow 1 typo
-                    }
+                    "fuzzy": _AUTOSUGGEST_FUZZY
                 }
             }
         },
         # Project only the needed fields
-        {
-            "$project": {
-                "_id": 0,
-                "id": 1,
-                "title": 1,
-                "brand": 1
-            }
-        },
+        _AUTOSUGGEST_PROJECTION,
         # Limit results
-        {
-            "$limit": query.limit
-        }
+        {"$limit": query.limit}
     ]
     
-    # Check cache first
-    cache_key = {"prefix": query.prefix, "limit": query.limit}
-    cached_result = search_cache.get(cache_key)
-    
-    if cached_result:
-        return cached_result
-    
     # Start timing for performance monitoring
     start_time = time.time()
     
     # Execute query
     try:
-        results = await collection.aggregate(pipeline).to_list(query.limit)
+        # Size the first batch to the limit so the results arrive without a getMore
+        results = await collection.aggregate(pipeline, batchSize=query.limit).to_list(query.limit)
         
-        # Cache the result
-        search_cache.set(cache_key, results)
+        # Cache the encoded result; plain dicts from the projection need no validation
+        payload = orjson.dumps(results)
+        search_cache.set(cache_key, payload, product_ids=[item.get("id") for item in results])
         
         # Record processing time
         processing_time = time.time() - start_time
         request.state.processing_time = processing_time
         
-        return results
+        return Response(content=payload, media_type="application/json")
     except Exception as e:
         print(f"Autosuggest error: {str(e)}")
         raise HTTPException(
@@ -241,29 +297,39 @@ async def autosuggest(request: Request, query: AutosuggestQuery = Body(...)):
         )
 
 @router.post("/query-explain", response_model=Dict[str, Any])
-async def query_explain(request: Request, query: ProductSearchQuery = Body(...)):
+async def query_explain(
+    request: Request,
+    query: ProductSearchQuery = Body(...),
+    include_embedding: bool = Query(True, description="Include a sample of the query embedding")
+):
     """
     Debug endpoint to show how query was interpreted (embeddings, terms used, etc.)
     """
-    # Generate embedding for the query
-    query_embedding = embedding_service.generate_embedding(query.query)
-    
-    # Truncate embedding for display purposes
-    truncated_embedding = query_embedding[:10] + ["..."] if len(query_embedding) > 10 else query_embedding
+    if include_embedding:
+        # Shares the cached embedding computed by /search for the same query
+        query_embedding = await embedding_service.embed_query(query.query)
+        
+        # Truncate embedding for display purposes
+        truncated_embedding = query_embedding[:10] + ["..."] if len(query_embedding) > 10 else query_embedding
+    else:
+        # Skip the model entirely when only the query interpretation is needed
+        query_embedding = None
+        truncated_embedding = None
     
     # Build explanation
     explanation = {
         "query_text": query.query,
         "query_tokens": query.query.split(),
-        "embedding_dimensions": len(query_embedding),
+        "embedding_dimensions": len(query_embedding) if query_embedding is not None else EMBEDDING_DIMENSIONS,
         "embedding_sample": truncated_embedding,
         "filters_applied": query.filters,
-        "search_strategy": "Combined vector (knnBeta) and keyword search"
+        "search_strategy": "Vector ($vectorSearch) and keyword ($search) results combined with reciprocal rank fusion"
     }
     
     # Get cache stats for the explanation
     cache_stats = {
         "search_cache": search_cache.get_stats(),
+        "semantic_search_cache": semantic_search_cache.get_stats(),
         "product_cache": product_cache.get_stats(),
         "recommendations_cache": recommendations_cache.get_stats()
     }
@@ -291,7 +357,7 @@ async def log_feedback(feedback: Dict[str, Any] = Body(...)):
     # }
     
     # For now, just log to console
-    print(f"Search feedback received: {json.dumps(feedback)}")
+    print(f"Search feedback received: {orjson.dumps(feedback).decode()}")
     
     return {"status": "feedback received"}
 
@@ -303,7 +369,7 @@ async def consolidated_search(request: Request, query: ConsolidatedSearchRequest
     This is ideal for unified search experiences where different result types are displayed together.
     
     - Categories: Exact substring matches
-    - Brands: Exact substring matches
+    - Brands: Case-insensitive prefix matches
     - Products: Combination of exact, ngram, and vector search
     """
     # Validate minimum query length
@@ -314,42 +380,35 @@ async def consolidated_search(request: Request, query: ConsolidatedSearchRequest
         )
     
     # Check cache first
-    cache_key = query.dict()
+    cache_key = {"endpoint": "consolidated-search", **query.model_dump()}
     cached_result = search_cache.get(cache_key)
     if cached_result:
-        return cached_result
+        return Response(content=cached_result, media_type="application/json")
     
     # Start timing for performance monitoring
     start_time = time.time()
     
     # Get database collection
-    collection = await get_product_collection()
-    db = await get_database()
+    collection = get_product_collection()
     
     # Generate embeddings for vector search if needed (for multi-word queries)
+    # The semantic cache is not used here: categories, brands and the product
+    # match types are lexical, so a near-identical query can have different results
     embeddings = None
     if query.includeVectorSearch and " " in query.query:
-        embeddings = embedding_service.generate_embedding(query.query)
-    
-    # Execute parallel searches for each result type
-    categories_task = search_categories(db, collection, query.query, query.maxCategories)
-    brands_task = search_brands(db, collection, query.query, query.maxBrands)
-    products_task = search_products_consolidated(
-        db, 
-        collection, 
-        query.query, 
-        embeddings, 
+        embeddings = await embedding_service.embed_query(query.query)
+    
+    # Categories, brands and products are searched concurrently, one aggregation each
+    categories, brands, products = await search_consolidated(
+        collection,
+        query.query,
+        embeddings,
+        query.maxCategories,
+        query.maxBrands,
         query.maxProducts,
         query.includeVectorSearch
     )
     
-    # Wait for all searches to complete concurrently
-    categories, brands, products = await asyncio.gather(
-        categories_task, 
-        brands_task, 
-        products_task
-    )
-    
     # Calculate processing time
     processing_time = (time.time() - start_time) * 1000
     
@@ -365,234 +424,253 @@ async def consolidated_search(request: Request, query: ConsolidatedSearchRequest
         }
     )
     
-    # Cache the result
-    search_cache.set(cache_key, response.dict())
+    # Cache the encoded result
+    payload = orjson.dumps(response.model_dump())
+    search_cache.set(
+        cache_key,
+        payload,
+        product_ids=[product.get("id") for product in products]
+    )
     
     # Record processing time for monitoring
     request.state.processing_time = processing_time
     
-    return response
+    # The response was validated when ConsolidatedSearchResponse was built
+    return Response(content=payload, media_type="application/json")
 
 
-async def search_categories(db, collection, query_text: str, max_results: int) -> List[CategoryResult]:
+def categories_pipeline(query_text: str, max_results: int) -> List[Dict[str, Any]]:
     """
-    Search for categories with exact substring matches
+    Build the pipeline for categories with exact substring matches.
+    Unlike brands_pipeline this does not use CASE_INSENSITIVE_COLLATION: a
+    substring can only be matched with a regex, regexes do not honour
+    collation, and a collated $group would merge category ids that differ
+    only in case.
     """
     # Extract unique categories from the product collection
     # MongoDB doesn't have a built-in categories collection, so we need to query products
     # and extract unique categories
-    try:
-        # This is a simplified approach - in a real application, you might have a separate categories collection
-        pipeline = [
-            # Find products where category name or slug contains the query (case insensitive)
-            {
-                "$match": {
-                    "$or": [
-                        {"categories.name": {"$regex": query_text, "$options": "i"}},
-                        {"categories.slug": {"$regex": query_text, "$options": "i"}}
-                    ]
-                }
-            },
-            # Unwind categories array to work with individual categories
-            {"$unwind": "$categories"},
-            # Filter to only include categories that match the query
-            {
-                "$match": {
-                    "$or": [
-                        {"categories.name": {"$regex": query_text, "$options": "i"}},
-                        {"categories.slug": {"$regex": query_text, "$options": "i"}}
-                    ]
-                }
-            },
-            # Group by category id to get unique categories and count products
-            {
-                "$group": {
-                    "_id": "$categories.id",
-                    "name": {"$first": "$categories.name"},
-                    "slug": {"$first": "$categories.slug"},
-                    "productCount": {"$sum": 1}
-                }
-            },
-            # Sort by product count (most popular categories first)
-            {"$sort": {"productCount": -1}},
-            # Limit to max_results
-            {"$limit": max_results},
-            # Project to final format
-            {
-                "$project": {
-                    "_id": 0,
-                    "id": "$_id",
-                    "name": 1,
-                    "slug": 1,
-                    "productCount": 1
-                }
+    # This is a simplified approach - in a real application, you might have a separate categories collection
+    # The query is matched literally, so regex metacharacters in it are escaped
+    pattern = re.escape(query_text)
+    return [
+        # Find products where category name or slug contains the query (case insensitive).
+        # This document-level match can use the categories.name/slug indexes and keeps
+        # non-matching products out of the $unwind
+        {
+            "$match": {
+                "$or": [
+                    {"categories.name": {"$regex": pattern, "$options": "i"}},
+                    {"categories.slug": {"$regex": pattern, "$options": "i"}}
+                ]
             }
-        ]
-        
-        # Execute the pipeline
-        cursor = collection.aggregate(pipeline)
-        results = await cursor.to_list(length=max_results)
-        
-        # Convert to CategoryResult objects
-        return [CategoryResult(**result) for result in results]
-    except Exception as e:
-        print(f"Error searching categories: {str(e)}")
-        # Return empty list on error rather than failing the whole response
-        return []
+        },
+        # Unwind categories array to work with individual categories
+        {"$unwind": "$categories"},
+        # Filter to only include categories that match the query; a matching product
+        # can also carry categories that do not match
+        {
+            "$match": {
+                "$or": [
+                    {"categories.name": {"$regex": pattern, "$options": "i"}},
+                    {"categories.slug": {"$regex": pattern, "$options": "i"}}
+                ]
+            }
+        },
+        # Group by category id to get unique categories and count products
+        {
+            "$group": {
+                "_id": "$categories.id",
+                "name": {"$first": "$categories.name"},
+                "slug": {"$first": "$categories.slug"},
+                "productCount": {"$sum": 1}
+            }
+        },
+        # Sort by product count (most popular categories first)
+        {"$sort": {"productCount": -1}},
+        # Limit to max_results
+        {"$limit": max_results},
+        # Project to final format
+        {
+            "$project": {
+                "_id": 0,
+                "id": "$_id",
+                "name": 1,
+                "slug": 1,
+                "productCount": 1
+            }
+        }
+    ]
 
 
-async def search_brands(db, collection, query_text: str, max_results: int) -> List[BrandResult]:
+def brands_pipeline(query_text: str, max_results: int) -> List[Dict[str, Any]]:
     """
-    Search for brands with exact substring matches
+    Build the pipeline for brands starting with the query.
+    Must run with CASE_INSENSITIVE_COLLATION, which makes the prefix range
+    case-insensitive and lets it use the brand_ci index.
     """
-    try:
-        # Find brands that match the query
-        pipeline = [
-            # Match products where brand contains the query (case insensitive)
-            {"$match": {"brand": {"$regex": query_text, "$options": "i"}}},
-            # Group by brand to get unique brands and count products
-            {
-                "$group": {
-                    "_id": "$brand",
-                    "productCount": {"$sum": 1}
-                }
-            },
-            # Sort by product count (most popular brands first)
-            {"$sort": {"productCount": -1}},
-            # Limit to max_results
-            {"$limit": max_results},
-            # Project to final format
-            {
-                "$project": {
-                    "_id": 0,
-                    "id": "$_id",  # Use brand name as ID
-                    "name": "$_id",
-                    "productCount": 1
-                }
+    return [
+        # Match products where brand starts with the query; U+FFFF sorts after every character
+        {"$match": {"brand": {"$gte": query_text, "$lt": query_text + "\uffff"}}},
+        # Count products per brand, most popular brands first
+        {"$sortByCount": "$brand"},
+        # Limit to max_results
+        {"$limit": max_results},
+        # Project to final format
+        {
+            "$project": {
+                "_id": 0,
+                "id": "$_id",  # Use brand name as ID
+                "name": "$_id",
+                "productCount": "$count"
             }
-        ]
-        
-        # Execute the pipeline
-        cursor = collection.aggregate(pipeline)
-        results = await cursor.to_list(length=max_results)
-        
-        # Convert to BrandResult objects
-        return [BrandResult(**result) for result in results]
-    except Exception as e:
-        print(f"Error searching brands: {str(e)}")
-        # Return empty list on error rather than failing the whole response
-        return []
+        }
+    ]
 
 
-async def search_products_consolidated(db, collection, query_text: str, embeddings: List[float], 
-                                       max_results: int, include_vector_search: bool) -> List[Dict[str, Any]]:
+# Static parts of the consolidated product pipeline
+# Exact match (highest boost)
+_CONSOLIDATED_EXACT_MATCH = {"path": ["title", "description", "brand"], "score": {"boost": {"value": 5}}}
+# Substring/fuzzy match
+_CONSOLIDATED_FUZZY_MATCH = {"path": "title", "fuzzy": {"maxEdits": 1}, "score": {"boost": {"value": 3}}}
+# Ngram match for partial words
+_CONSOLIDATED_NGRAM_MATCH = {"path": "title", "tokenOrder": "any", "score": {"boost": {"value": 2}}}
+# Match type of products whose title does not contain the query, from the keyword score
+_CONSOLIDATED_WEAK_MATCH_TYPE = {"$cond": [{"$gt": [{"$meta": "searchScore"}, 1.5]}, "ngram", "vector"]}
+# Project only needed fields
+_CONSOLIDATED_PRODUCT_PROJECTION = {
+    "$project": {
+        "_id": 0,
+        "id": 1,
+        "title": 1,
+        "description": 1,
+        "brand": 1,
+        "imageThumbnailUrl": 1,
+        "priceOriginal": 1,
+        "priceCurrent": 1,
+        "isOnSale": 1,
+        "score": 1,
+        "matchType": 1
+    }
+}
+
+def products_consolidated_pipeline(collection_name: str, query_text: str, embeddings: Optional[List[float]],
+                                   max_results: int, include_vector_search: bool) -> List[Dict[str, Any]]:
     """
-    Search for products using multiple strategies:
+    Build the pipeline for products using multiple strategies:
     1. Exact matching
     2. Substring matching
     3. Ngram matching
     4. Vector search (if enabled and query has multiple words)
     """
-    try:
-        # Build MongoDB Atlas search pipeline with multiple strategies
-        search_stage = {
-            "$search": {
-                "index": "product_search",  # Atlas Search index
-                "compound": {
-                    "should": [
-                        # Exact match (highest boost)
-                        {
-                            "text": {
-                                "query": query_text,
-                                "path": ["title", "description", "brand"],
-                                "score": {"boost": {"value": 5}}
-                            }
-                        },
-                        # Substring/fuzzy match
-                        {
-                            "text": {
-                                "query": query_text,
-                                "path": "title",
-                                "fuzzy": {"maxEdits": 1},
-                                "score": {"boost": {"value": 3}}
-                            }
-                        },
-                        # Ngram match for partial words
-                        {
-                            "autocomplete": {
-                                "query": query_text,
-                                "path": "title",
-                                "tokenOrder": "any",
-                                "score": {"boost": {"value": 2}}
-                            }
-                        }
-                    ]
-                }
+    # Build MongoDB Atlas search pipeline with multiple strategies
+    search_stage = {
+        "$search": {
+            "index": "product_search",  # Atlas Search index
+            "compound": {
+                "should": [
+                    {"text": {**_CONSOLIDATED_EXACT_MATCH, "query": query_text}},
+                    {"text": {**_CONSOLIDATED_FUZZY_MATCH, "query": query_text}},
+                    {"autocomplete": {**_CONSOLIDATED_NGRAM_MATCH, "query": query_text}}
+                ]
             }
         }
-        
-        # Add vector search if enabled and we have embeddings
-        if include_vector_search and embeddings and " " in query_text:
-            vector_stage = {
-                "knnBeta": {
-                    "vector": embeddings,
-                    "path": "title_embedding",
-                    "k": 50,
-                    "score": {"boost": {"value": 1}}
-                }
+    }
+    
+    # Determine the match type from the keyword score
+    match_type_stage = {
+        "$addFields": {
+            "score": {"$meta": "searchScore"},
+            "matchType": {
+                "$cond": [
+                    # Check if title contains exact query (case insensitive)
+                    {"$regexMatch": {"input": "$title", "regex": re.escape(query_text), "options": "i"}},
+                    "exact",
+                    _CONSOLIDATED_WEAK_MATCH_TYPE
+                ]
             }
-            search_stage["$search"]["compound"]["should"].append(vector_stage)
-        
-        # Build the full pipeline
-        pipeline = [
-            search_stage,
-            # Add a stage to determine match type
-            {
-                "$addFields": {
-                    "score": {"$meta": "searchScore"},
-                    "matchType": {
-                        "$cond": [
-                            # Check if title contains exact query (case insensitive)
-                            {"$regexMatch": {"input": "$title", "regex": query_text, "options": "i"}},
-                            "exact",
-                            # Check score to determine if it's ngram or vector match
-                            {
-                                "$cond": [
-                                    {"$gt": [{"$meta": "searchScore"}, 1.5]},
-                                    "ngram",
-                                    "vector"
-                                ]
-                            }
-                        ]
-                    }
-                }
-            },
-            # Limit to max_results
-            {"$limit": max_results},
-            # Project only needed fields
-            {
-                "$project": {
-                    "_id": 0,
-                    "id": 1,
-                    "title": 1,
-                    "description": 1,
-                    "brand": 1,
-                    "imageThumbnailUrl": 1,
-                    "priceOriginal": 1,
-                    "priceCurrent": 1,
-                    "isOnSale": 1,
-                    "score": 1,
-                    "matchType": 1
-                }
+        }
+    }
+    
+    # Keyword search only
+    if not (include_vector_search and embeddings and " " in query_text):
+        return [search_stage, match_type_stage, {"$limit": max_results}, _CONSOLIDATED_PRODUCT_PROJECTION]
+    
+    # Add vector search if enabled and we have embeddings; the keyword and vector
+    # rankings are combined with reciprocal rank fusion, and the score becomes the fused score
+    pipeline = [
+        search_stage,
+        {"$limit": max_results},
+        match_type_stage,
+        *rrf_rank_stages(1.0),
+        {
+            "$unionWith": {
+                "coll": collection_name,
+                "pipeline": [
+                    vector_search_stage(_TITLE_VECTOR, embeddings, max_results),
+                    *rrf_rank_stages(1.0)
+                ]
             }
-        ]
-        
-        # Execute the pipeline
-        cursor = collection.aggregate(pipeline)
-        results = await cursor.to_list(length=max_results)
-        
-        return results
+        },
+        *_RRF_FUSE_STAGES,
+        {"$limit": max_results},
+        # Products found only by vector search have no keyword match type
+        {"$addFields": {"matchType": {"$ifNull": ["$matchType", "vector"]}, "score": "$_rrf"}},
+        _CONSOLIDATED_PRODUCT_PROJECTION
+    ]
+    
+    return pipeline
+
+
+async def _consolidated_branch(name: str, cursor, max_results: int, model=None) -> List[Any]:
+    """
+    Collect one branch of the consolidated search.
+    A failing branch is logged and comes back empty, so it does not take the
+    other result types down with it.
+    """
+    try:
+        rows = await cursor.to_list(length=max_results)
+        return [model(**row) for row in rows] if model else rows
     except Exception as e:
-        print(f"Error searching products: {str(e)}")
+        print(f"Error searching {name}: {str(e)}")
         # Return empty list on error rather than failing the whole response
         return []
+
+
+async def search_consolidated(collection, query_text: str, embeddings: Optional[List[float]],
+                              max_categories: int, max_brands: int, max_products: int,
+                              include_vector_search: bool):
+    """
+    Search categories, brands and products concurrently.
+    Each result type runs as its own aggregation, so an error in one branch
+    only empties that branch.
+    """
+    # Every row fits in the first batch, so the results arrive without a getMore
+    return await asyncio.gather(
+        _consolidated_branch(
+            "categories",
+            collection.aggregate(categories_pipeline(query_text, max_categories), batchSize=max_categories),
+            max_categories,
+            CategoryResult
+        ),
+        _consolidated_branch(
+            "brands",
+            collection.aggregate(
+                brands_pipeline(query_text, max_brands),
+                collation=CASE_INSENSITIVE_COLLATION,
+                batchSize=max_brands
+            ),
+            max_brands,
+            BrandResult
+        ),
+        _consolidated_branch(
+            "products",
+            collection.aggregate(
+                products_consolidated_pipeline(
+                    collection.name, query_text, embeddings, max_products, include_vector_search
+                ),
+                batchSize=max_products
+            ),
+            max_products
+        )
+    )
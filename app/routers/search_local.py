@@ -3,14 +3,15 @@ A simplified search implementation for local testing that doesn't depend on
 MongoDB Atlas Search features. This module is used when TEST_MODE is enabled.
 """
 from fastapi import APIRouter, HTTPException, status, Body, Request, Depends
+from fastapi.responses import Response
 from typing import List, Dict, Any, Optional
 import json
 import time
+import orjson
 import re
-import random
 
 from models.product import ProductSearchQuery, AutosuggestQuery, SearchResult, FacetResult
-from database.mongodb import get_product_collection
+from database.mongodb import get_product_collection, NO_EMBEDDING_PROJECTION
 from services.embedding import embedding_service
 from services.cache import search_cache
 from dependencies import get_api_key
@@ -29,26 +30,28 @@ async def search_products(request: Request, query: ProductSearchQuery = Body(...
     start_time = time.time()
     
     # Check cache first
-    cache_key = f"search:{query.query}:{query.limit}:{query.offset}:{json.dumps(query.filters or {})}"
+    cache_key = {
+        "endpoint": "local-search",
+        "query": query.query,
+        "filters": query.filters or {},
+        "offset": query.offset,
+        "limit": query.limit
+    }
     cached_result = search_cache.get(cache_key)
     if cached_result:
         request.state.processing_time = 0.001  # Negligible time for cache hit
-        return SearchResult(**cached_result)
+        # Cached responses are already encoded JSON
+        return Response(content=cached_result, media_type="application/json")
     
-    collection = await get_product_collection()
+    collection = get_product_collection()
     
     # Build a simple filter for MongoDB find() operation
     mongo_filter = {}
     
-    # Add text search with regex
+    # Add keyword search through the title/description/brand text index,
+    # instead of unanchored regexes that scan every document
     if query.query:
-        # Case-insensitive regex search
-        text_regex = re.compile(f".*{re.escape(query.query)}.*", re.IGNORECASE)
-        mongo_filter["$or"] = [
-            {"title": {"$regex": text_regex}},
-            {"description": {"$regex": text_regex}},
-            {"brand": {"$regex": text_regex}}
-        ]
+        mongo_filter["$text"] = {"$search": query.query, "$caseSensitive": False}
     
     # Add user filters
     if query.filters:
@@ -56,56 +59,59 @@ async def search_products(request: Request, query: ProductSearchQuery = Body(...
             if key not in mongo_filter:
                 mongo_filter[key] = value
     
+    # Page of results, total count and facet counts come from one $facet aggregation
+    # over the matched set instead of a count, a find and one aggregation per facet
+    facet_fields = ["brand", "color", "productType", "isOnSale", "seasons"]
+    array_facet_fields = {"seasons"}
+    if query.query:
+        # Best keyword matches first
+        results_branch = [{"$sort": {"score": -1}}, {"$skip": query.offset}, {"$limit": query.limit}]
+    else:
+        # Without a query there is no text score, so give the page a random one in [0.5, 1.0)
+        results_branch = [
+            {"$skip": query.offset},
+            {"$limit": query.limit},
+            {"$addFields": {"score": {"$add": [0.5, {"$multiply": [0.5, {"$rand": {}}]}]}}}
+        ]
+    facet_stage = {
+        "results": results_branch + [{"$project": NO_EMBEDDING_PROJECTION}],
+        "total": [{"$count": "count"}]
+    }
+    for field in facet_fields:
+        # Array-valued fields are counted per element rather than per array
+        facet_stage[field] = ([{"$unwind": f"${field}"}] if field in array_facet_fields else []) + [
+            {"$sortByCount": f"${field}"},
+            {"$limit": 10}
+        ]
+    
+    pipeline = [{"$match": mongo_filter}]
+    if query.query:
+        # Expose the text score as a field so the results branch can sort on it
+        pipeline.append({"$addFields": {"score": {"$meta": "textScore"}}})
+    pipeline.append({"$facet": facet_stage})
+    
+    facet_results = await collection.aggregate(pipeline).to_list(1)
+    facet_result = facet_results[0] if facet_results else {}
+    
     # Get total count for pagination
-    total_count = await collection.count_documents(mongo_filter)
+    total = facet_result.get("total")
+    total_count = total[0]["count"] if total else 0
     
-    # Execute find with pagination
-    cursor = collection.find(
-        mongo_filter, 
-        skip=query.offset,
-        limit=query.limit
-    )
+    # Results arrive scored, without _id and embedding vectors
+    products = facet_result.get("results", [])
     
-    # Process results
-    products = []
-    async for doc in cursor:
-        # Convert MongoDB _id to string and remove from response
-        if "_id" in doc:
-            doc["_id"] = str(doc["_id"])
-        
-        # Add a random score since we can't use Atlas Search scoring
-        doc["score"] = random.uniform(0.5, 1.0)
-        
-        # Add to results
-        products.append(doc)
-    
-    # Generate facets by analyzing all matching documents
-    # This is not efficient for large collections but works for testing
     facets = []
-    facet_fields = ["brand", "color", "productType", "isOnSale", "seasons"]
-    
-    if total_count > 0 and total_count < 1000:  # Only calculate facets for reasonable result sets
-        for field in facet_fields:
-            facet_cursor = collection.aggregate([
-                {"$match": mongo_filter},
-                {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
-                {"$sort": {"count": -1}},
-                {"$limit": 10}
-            ])
-            
-            values = []
-            async for facet_value in facet_cursor:
-                if facet_value["_id"] is not None:
-                    values.append({
-                        "value": facet_value["_id"],
-                        "count": facet_value["count"]
-                    })
-            
-            if values:
-                facets.append({
-                    "name": field,
-                    "values": values
-                })
+    for field in facet_fields:
+        values = [
+            {"value": facet_value["_id"], "count": facet_value["count"]}
+            for facet_value in facet_result.get(field, [])
+            if facet_value["_id"] is not None
+        ]
+        if values:
+            facets.append({
+                "field": field,
+                "values": values
+            })
     
     # Calculate processing time
     processing_time = time.time() - start_time
@@ -118,13 +124,19 @@ async def search_products(request: Request, query: ProductSearchQuery = Body(...
         total=total_count
     )
     
-    # Cache the result
-    search_cache.set(cache_key, response.dict())
+    # Cache the encoded result
+    payload = orjson.dumps(response.model_dump())
+    search_cache.set(
+        cache_key,
+        payload,
+        product_ids=[product.get("id") for product in products]
+    )
     
     # Record processing time for monitoring
     request.state.processing_time = processing_time
     
-    return response
+    # The response was validated when SearchResult was built
+    return Response(content=payload, media_type="application/json")
 
 @router.post("/autosuggest", response_model=List[Dict[str, Any]])
 async def autosuggest(request: Request, query: AutosuggestQuery = Body(...)):
@@ -132,13 +144,13 @@ async def autosuggest(request: Request, query: AutosuggestQuery = Body(...)):
     Simplified autosuggest endpoint for local testing
     """
     # Check cache first
-    cache_key = f"autosuggest:{query.prefix}:{query.limit}"
+    cache_key = {"endpoint": "local-autosuggest", "prefix": query.prefix, "limit": query.limit}
     cached_result = search_cache.get(cache_key)
     if cached_result:
-        return cached_result
+        return Response(content=cached_result, media_type="application/json")
     
     start_time = time.time()
-    collection = await get_product_collection()
+    collection = get_product_collection()
     
     # Simple prefix match with regex
     regex = re.compile(f"^{re.escape(query.prefix)}.*", re.IGNORECASE)
@@ -147,18 +159,17 @@ async def autosuggest(request: Request, query: AutosuggestQuery = Body(...)):
         {"_id": 0, "id": 1, "title": 1, "brand": 1}
     ).limit(query.limit)
     
-    results = []
-    async for doc in cursor:
-        results.append(doc)
+    results = await cursor.to_list(query.limit)
     
-    # Cache results
-    search_cache.set(cache_key, results)
+    # Cache the encoded results
+    payload = orjson.dumps(results)
+    search_cache.set(cache_key, payload, product_ids=[item.get("id") for item in results])
     
     # Record processing time
     processing_time = time.time() - start_time
     request.state.processing_time = processing_time
     
-    return results
+    return Response(content=payload, media_type="application/json")
 
 @router.post("/query-explain", response_model=Dict[str, Any])
 async def query_explain(request: Request, query: ProductSearchQuery = Body(...)):
@@ -166,7 +177,7 @@ async def query_explain(request: Request, query: ProductSearchQuery = Body(...))
     Debug endpoint to explain how the local search works
     """
     # Generate embedding (for test mode this will be random)
-    query_embedding = embedding_service.generate_embedding(query.query)
+    query_embedding = await embedding_service.embed_query(query.query)
     
     # Truncate embedding for display purposes
     truncated_embedding = query_embedding[:5] + ["..."] if len(query_embedding) > 5 else query_embedding
@@ -9,24 +9,48 @@ This script:
 
 The test focuses on the specific QA check requirements:
 "All of these searches should hit 'metaldetector': 'met', 'meta', 'metall', 'metalde', 'metaldetect'"
+
+The searches here are text-only, so products are stored without embeddings
+unless WITH_EMBEDDINGS=true is set (e.g. to reuse the dataset for vector search).
 """
 import os
 import sys
+import re
 import json
-from pymongo import MongoClient
-from pymongo.errors import OperationFailure
+import hashlib
+import sqlite3
+import numpy as np
+from pymongo import MongoClient, IndexModel
+from pymongo.errors import OperationFailure, BulkWriteError
+from pymongo.write_concern import WriteConcern
+
+# Stream the client data file if ijson is available
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 # Add parent directory to import path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import our application modules
-from services.embedding import embedding_service
+from utils.vectors import pack_embedding
 
 # Configuration
 CLIENT_DATA_PATH = r"C:\Users\Isaia\OneDrive\Documents\Coding\Dockerized MongoDb Atlas search\Omnium_Search_Products_START-1742999880951\Omnium_Search_Products_START-1742999880951.json"
 LOCAL_MONGODB_URI = "mongodb://localhost:27017"
 DB_NAME = "full_dataset_test"
 COLLECTION_NAME = "products"
+# Generate title and description embeddings; the text searches don't need them
+WITH_EMBEDDINGS = os.environ.get("WITH_EMBEDDINGS", "false").lower() in ("true", "1", "yes")
+# Embeddings from earlier runs, keyed by model and text hash
+EMBEDDING_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "embeddings.sqlite")
+
+# Fields the search tests read; the embeddings are never fetched
+PRODUCT_PROJECTION = {"_id": 0, "id": 1, "title": 1, "description": 1, "brand": 1}
+
+# Matches "metaldetector" and "metal detector" in any case
+METALDETECTOR_PATTERN = re.compile(r"metal ?detector", re.IGNORECASE)
 
 # Specific test queries for metaldetector
 METALDETECTOR_TEST_QUERIES = [
@@ -37,85 +61,171 @@ METALDETECTOR_TEST_QUERIES = [
     "metaldetect"
 ]
 
-def load_all_client_data(file_path):
-    """Load all products from the client data file"""
-    print(f"Loading data from {file_path}...")
-    
+def generate_embeddings_cached(texts):
+    """
+    Generate embeddings for a list of texts, reusing the ones stored on disk by
+    earlier runs. Only the misses are passed to the model, in one batched call.
+    """
+    # Loading the embedding service loads the model, so only import it when needed
+    from services.embedding import embedding_service, EMBEDDING_MODEL_NAME
+    
+    # Random test mode embeddings are not worth keeping
+    if embedding_service.model is None:
+        return embedding_service.generate_embeddings(texts)
+    
+    keys = [hashlib.sha256(f"{EMBEDDING_MODEL_NAME}\0{text}".encode("utf-8")).digest() for text in texts]
+    
+    os.makedirs(os.path.dirname(EMBEDDING_CACHE_PATH), exist_ok=True)
+    conn = sqlite3.connect(EMBEDDING_CACHE_PATH)
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception as e:
-        print(f"Error loading data: {e}")
-        return {}
+        conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+        
+        # Look up the stored embeddings (SQLite limits the number of query parameters)
+        stored = {}
+        distinct_keys = list(set(keys))
+        for i in range(0, len(distinct_keys), 500):
+            chunk = distinct_keys[i:i + 500]
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for key, vector in rows:
+                stored[key] = np.frombuffer(vector, dtype=np.float32)
+        
+        # Embed the misses and store them for the next run
+        missing = [i for i, key in enumerate(keys) if key not in stored]
+        print(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+        if missing:
+            new_embeddings = embedding_service.generate_embeddings([texts[i] for i in missing])
+            for i, embedding in zip(missing, new_embeddings):
+                stored[keys[i]] = embedding
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(keys[i], np.asarray(stored[keys[i]], dtype=np.float32).tobytes()) for i in missing]
+                )
+    finally:
+        conn.close()
     
-    if not data or "result" not in data:
-        print("No data found or invalid format")
-        return {}
+    return [stored[key] for key in keys]
+
+def iter_client_products(file_path):
+    """
+    Yield the products of the client data file one at a time.
+    With ijson installed the file is streamed, so the whole parsed dataset is
+    never held in memory next to the transformed products.
+    """
+    if ijson is None:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            yield from json.load(f).get("result", [])
+        return
     
-    # Get all products
-    all_products = data.get("result", [])
-    print(f"Total products in file: {len(all_products)}")
+    with open(file_path, 'rb') as f:
+        # Parse numbers as floats; BSON cannot encode Decimals
+        yield from ijson.items(f, "result.item", use_float=True)
+
+def load_all_client_data(file_path):
+    """Load all products from the client data file"""
+    print(f"Loading data from {file_path}...")
     
     # Transform to our model
     transformed_products = []
     categories = {}
     brands = {}
+    total_products = 0
     
-    for item in all_products:
-        try:
-            # Extract category data
-            for cat in item.get("categories", []):
-                if cat.get("categoryId") and cat.get("name"):
+    try:
+        for item in iter_client_products(file_path):
+            total_products += 1
+            try:
+                # Extract category data
+                for cat in item.get("categories", []):
                     cat_id = cat.get("categoryId")
-                    categories[cat_id] = {
-                        "id": cat_id,
-                        "name": cat.get("name", ""),
-                        "slug": cat.get("name", "").lower().replace(" ", "-"),
-                        "productCount": categories.get(cat_id, {}).get("productCount", 0) + 1
-                    }
-            
-            # Extract brand data
-            supplier_name = item.get("supplierName", "Unknown")
-            if supplier_name:
-                brand_id = f"brand_{supplier_name.lower().replace(' ', '_')}"
-                brands[brand_id] = {
-                    "id": brand_id,
-                    "name": supplier_name,
-                    "productCount": brands.get(brand_id, {}).get("productCount", 0) + 1
+                    cat_name = cat.get("name")
+                    if cat_id and cat_name:
+                        category = categories.get(cat_id)
+                        if category is None:
+                            category = categories[cat_id] = {
+                                "id": cat_id,
+                                "name": cat_name,
+                                "slug": cat_name.lower().replace(" ", "-"),
+                                "productCount": 0
+                            }
+                        category["productCount"] += 1
+                
+                # Extract brand data
+                supplier_name = item.get("supplierName", "Unknown")
+                if supplier_name:
+                    brand_id = f"brand_{supplier_name.lower().replace(' ', '_')}"
+                    brand = brands.get(brand_id)
+                    if brand is None:
+                        brand = brands[brand_id] = {
+                            "id": brand_id,
+                            "name": supplier_name,
+                            "productCount": 0
+                        }
+                    brand["productCount"] += 1
+                    
+                # Read the prices and the color selector once
+                price = item.get("price") or {}
+                unit_price = float(price.get("unitPrice", 0))
+                original_price = float(price.get("originalUnitPrice", 0))
+                color = None
+                for prop in item.get("properties") or ():
+                    if prop.get("key") == "ProductSelector" and prop.get("value") == "Farge":
+                        color = prop.get("value")
+                        break
+                
+                # Transform to our product model
+                product = {
+                    "id": item.get("id", f"product_{len(transformed_products)}"),
+                    "title": item.get("name", "Untitled Product"),
+                    "description": item.get("alternativeProductName", item.get("name", "No description")),
+                    "brand": item.get("supplierName", "Unknown"),
+                    "imageThumbnailUrl": item.get("imageUrl", ""),
+                    "priceOriginal": original_price,
+                    "priceCurrent": unit_price,
+                    "isOnSale": unit_price < original_price,
+                    "ageFrom": None,
+                    "ageTo": None,
+                    "ageBucket": None,
+                    "color": color,
+                    "seasons": [],
+                    "productType": "main",
+                    "seasonRelevancyFactor": 0.5,
+                    "stockLevel": int(item.get("availableInventory", 0))
                 }
                 
-            # Transform to our product model
-            product = {
-                "id": item.get("id", f"product_{len(transformed_products)}"),
-                "title": item.get("name", "Untitled Product"),
-                "description": item.get("alternativeProductName", item.get("name", "No description")),
-                "brand": item.get("supplierName", "Unknown"),
-                "imageThumbnailUrl": item.get("imageUrl", ""),
-                "priceOriginal": float(item.get("price", {}).get("originalUnitPrice", 0)),
-                "priceCurrent": float(item.get("price", {}).get("unitPrice", 0)),
-                "isOnSale": float(item.get("price", {}).get("unitPrice", 0)) < float(item.get("price", {}).get("originalUnitPrice", 0)),
-                "ageFrom": None,
-                "ageTo": None,
-                "ageBucket": None,
-                "color": next((prop.get("value") for prop in item.get("properties", []) if prop.get("key") == "ProductSelector" and prop.get("value") == "Farge"), None),
-                "seasons": [],
-                "productType": "main",
-                "seasonRelevancyFactor": 0.5,
-                "stockLevel": int(item.get("availableInventory", 0))
-            }
-            
-            # Add additional fields from client data
-            product["supplierItemId"] = item.get("supplierItemId", "")
-            product["productAttributes"] = item.get("productAttributes", {})
-            product["alternativeProductName"] = item.get("alternativeProductName", "")
-            
-            # Generate embeddings for vector search
-            product["title_embedding"] = embedding_service.generate_embedding(product["title"])
-            product["description_embedding"] = embedding_service.generate_embedding(product["description"])
-            
-            transformed_products.append(product)
-        except Exception as e:
-            print(f"Error transforming product {item.get('id', 'unknown')}: {e}")
+                # Add additional fields from client data
+                product["supplierItemId"] = item.get("supplierItemId", "")
+                product["productAttributes"] = item.get("productAttributes", {})
+                product["alternativeProductName"] = item.get("alternativeProductName", "")
+                
+                transformed_products.append(product)
+            except Exception as e:
+                print(f"Error transforming product {item.get('id', 'unknown')}: {e}")
+    except Exception as e:
+        print(f"Error loading data: {e}")
+        return {}
+    
+    if not total_products:
+        print("No data found or invalid format")
+        return {}
+    print(f"Total products in file: {total_products}")
+    
+    # Generate embeddings for vector search in batched model calls
+    if WITH_EMBEDDINGS:
+        print(f"Generating embeddings for {len(transformed_products)} products...")
+        titles = [product["title"] for product in transformed_products]
+        descriptions = [product["description"] for product in transformed_products]
+        embeddings = generate_embeddings_cached(titles + descriptions)
+        for product, title_embedding, description_embedding in zip(
+            transformed_products, embeddings[:len(titles)], embeddings[len(titles):]
+        ):
+            # Store packed float32 vectors, like the ingest API does
+            product["title_embedding"] = pack_embedding(title_embedding)
+            product["description_embedding"] = pack_embedding(description_embedding)
+    else:
+        print("Skipping embeddings (set WITH_EMBEDDINGS=true to generate them)")
     
     return {
         "products": transformed_products,
@@ -123,39 +233,55 @@ def load_all_client_data(file_path):
         "brands": list(brands.values())
     }
 
-def initialize_local_database(connection_string, db_name, collection_name, data):
-    """Initialize local MongoDB database with the full dataset"""
-    print(f"Initializing local MongoDB database: {db_name}.{collection_name}")
-    
-    client = MongoClient(connection_string)
+def search_terms(*texts):
+    """
+    Get the distinct lowercase words of the texts. A case-sensitive, left-anchored
+    regex over these words is an index range scan that matches partial words,
+    so "^met" finds "metaldetector".
+    """
+    terms = set()
+    for text in texts:
+        terms.update(re.findall(r"\w+", (text or "").lower()))
+    return list(terms)
+
+def initialize_local_database(collection, data):
+    """Initialize the local MongoDB collection with the full dataset"""
+    print(f"Initializing local MongoDB database: {collection.full_name}")
     
     try:
-        # Get database and collection
-        db = client[db_name]
-        collection = db[collection_name]
+        # Drop existing data and indexes, so the bulk load doesn't update any index
+        collection.drop()
+        print(f"✅ Cleared existing data from {collection.name}")
         
-        # Clear existing data
-        collection.delete_many({})
-        print(f"✅ Cleared existing data from {collection_name}")
-        
-        # Insert products in batches to avoid memory issues
         products = data.get("products", [])
-        batch_size = 100
-        total_inserted = 0
+        for product in products:
+            product["search_terms"] = search_terms(product.get("title"), product.get("description"))
         
-        for i in range(0, len(products), batch_size):
-            batch = products[i:i + batch_size]
-            result = collection.insert_many(batch)
-            total_inserted += len(result.inserted_ids)
-            print(f"  Inserted batch {i//batch_size + 1} ({len(batch)} products)")
+        # The test database is disposable, so the seed load only waits for the
+        # primary to apply the writes, not for majority or journal acknowledgement.
+        # Unacknowledged (w=0) writes could still be in flight when the searches run.
+        load_collection = collection.with_options(write_concern=WriteConcern(w=1, j=False))
+        
+        # Insert all products in one unordered call; the driver splits it into
+        # wire-sized batches, and one failed document doesn't stop the rest
+        try:
+            result = load_collection.insert_many(products, ordered=False)
+            total_inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            total_inserted = e.details.get("nInserted", 0)
+            print(f"⚠️ {len(e.details.get('writeErrors', []))} products failed to insert")
         
         print(f"✅ Inserted {total_inserted} products in total")
         
-        # Create basic indexes
-        collection.create_index("title")
-        collection.create_index("description")
-        collection.create_index("brand")
-        print("✅ Created basic indexes")
+        # Build the indexes after the load, in one command: a text index for
+        # whole-word search and a multikey index on the lowercase words for
+        # prefix search
+        collection.create_indexes([
+            IndexModel([("title", "text"), ("description", "text")]),
+            IndexModel("search_terms"),
+            IndexModel("brand")
+        ])
+        print("✅ Created text, search term and brand indexes")
         
         return True
     except Exception as e:
@@ -163,64 +289,51 @@ def initialize_local_database(connection_string, db_name, collection_name, data)
         import traceback
         traceback.print_exc()
         return False
-    finally:
-        client.close()
 
 def find_metaldetector_products(collection):
     """Find all products with 'metaldetector' in title or description"""
-    query = {
-        "$or": [
-            {"title": {"$regex": "metaldetector", "$options": "i"}},
-            {"description": {"$regex": "metaldetector", "$options": "i"}}
-        ]
-    }
-    
-    metaldetector_products = []
-    cursor = collection.find(query)
+    query = {"$text": {"$search": "metaldetector"}}
     
-    for product in cursor:
-        metaldetector_products.append({
-            "id": product.get("id"),
-            "title": product.get("title"),
-            "description": product.get("description"),
-            "brand": product.get("brand")
-        })
-    
-    return metaldetector_products
+    # The projection already returns only the reported fields
+    return list(collection.find(query, PRODUCT_PROJECTION).batch_size(1000))
+
+def find_prefix_candidates(collection, queries):
+    """
+    Fetch every product that any of the prefix queries can match, in one scan.
+    A word starting with a query also starts with the queries' common prefix,
+    so the products with a word starting with that prefix are a superset of
+    each query's matches. Each candidate is checked for metaldetector once,
+    instead of again for every query that matches it.
+    """
+    common_prefix = os.path.commonprefix([query.lower() for query in queries])
+    
+    # The terms are stored lowercase, so the regex needs no "i" option and
+    # stays a bounded index scan
+    prefix_query = {"search_terms": {"$regex": f"^{re.escape(common_prefix)}"}}
+    projection = {**PRODUCT_PROJECTION, "search_terms": 1}
+    candidates = list(collection.find(prefix_query, projection).batch_size(1000))
+    
+    for product in candidates:
+        product["is_metaldetector"] = bool(
+            METALDETECTOR_PATTERN.search(product.get("title") or "")
+            or METALDETECTOR_PATTERN.search(product.get("description") or "")
+        )
+    
+    return candidates
 
-def test_metaldetector_search_query(collection, query):
-    """Test a specific metaldetector search query"""
+def test_metaldetector_search_query(candidates, query):
+    """Test a specific metaldetector search query against the prefix candidates"""
     print(f"\n----- Testing Query: '{query}' -----")
     
-    # Create regex query for products
-    regex_query = {
-        "$or": [
-            {"title": {"$regex": query, "$options": "i"}},
-            {"description": {"$regex": query, "$options": "i"}}
-        ]
-    }
-    
-    # Find products matching the query
-    matching_products = []
-    cursor = collection.find(regex_query).limit(20)
-    
-    for product in cursor:
-        matching_products.append({
-            "id": product.get("id"),
-            "title": product.get("title"),
-            "description": product.get("description"),
-            "brand": product.get("brand")
-        })
+    # Find products with a word starting with the query
+    prefix = query.lower()
+    matching_products = [
+        product for product in candidates
+        if any(term.startswith(prefix) for term in product.get("search_terms", ()))
+    ][:20]
     
     # Find metaldetector products among the matches
-    metaldetector_matches = []
-    
-    for product in matching_products:
-        title = product.get("title", "").lower()
-        description = product.get("description", "").lower()
-        
-        if "metaldetector" in title or "metaldetector" in description or "metal detector" in title or "metal detector" in description:
-            metaldetector_matches.append(product)
+    metaldetector_matches = [product for product in matching_products if product["is_metaldetector"]]
     
     # Print results
     print(f"Total matching products: {len(matching_products)}")
@@ -251,18 +364,18 @@ def main():
         print("❌ No products loaded from client data")
         return
     
+    # Connect once; loading and all searches share the client's connection pool
+    client = MongoClient(LOCAL_MONGODB_URI)
+    collection = client[DB_NAME][COLLECTION_NAME]
+    
     # Initialize local database with full dataset
-    success = initialize_local_database(LOCAL_MONGODB_URI, DB_NAME, COLLECTION_NAME, data)
+    success = initialize_local_database(collection, data)
     
     if not success:
         print("❌ Database initialization failed")
+        client.close()
         return
     
-    # Connect to the database
-    client = MongoClient(LOCAL_MONGODB_URI)
-    db = client[DB_NAME]
-    collection = db[COLLECTION_NAME]
-    
     # Find all metaldetector products in the dataset
     print("\nSearching for all metaldetector products in the dataset...")
     metaldetector_products = find_metaldetector_products(collection)
@@ -279,9 +392,10 @@ def main():
     # Run test queries
     print("\n===== TESTING BJORN'S REQUIRED QUERIES =====")
     results = []
+    candidates = find_prefix_candidates(collection, METALDETECTOR_TEST_QUERIES)
     
     for query in METALDETECTOR_TEST_QUERIES:
-        result = test_metaldetector_search_query(collection, query)
+        result = test_metaldetector_search_query(candidates, query)
         results.append(result)
     
     # Print summary
@@ -9,17 +9,25 @@ This script:
 """
 import os
 import sys
+import re
 import json
 import time
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from bson.regex import Regex
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+from pymongo.operations import SearchIndexModel
 from prettytable import PrettyTable
 
 # Add parent directory to import path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import our application modules
-from services.embedding import embedding_service
-from database.mongodb import DB
+from services.embedding import embedding_service, EMBEDDING_DIMENSIONS
+from database.mongodb import DB, VECTOR_INDEX_NAME, VECTOR_INDEX_DEFINITION
+from utils.vectors import pack_embedding, unpack_embedding
 
 # Configuration
 CLIENT_DATA_PATH = r"C:\Users\Isaia\OneDrive\Documents\Coding\Dockerized MongoDb Atlas search\Omnium_Search_Products_START-1742999880951\Omnium_Search_Products_START-1742999880951.json"
@@ -27,6 +35,14 @@ LOCAL_MONGODB_URI = "mongodb://localhost:27017"
 DB_NAME = "consolidated_search_test"
 COLLECTION_NAME = "products"
 
+# Product fields the test reports; embeddings and client attributes are never fetched
+PRODUCT_PROJECTION = {"_id": 0, "id": 1, "title": 1, "description": 1, "brand": 1}
+
+# Minimum cosine similarity for a vector match
+VECTOR_SIMILARITY_THRESHOLD = 0.5
+# Seconds to wait for a new vector search index to become queryable
+VECTOR_INDEX_READY_TIMEOUT = 120
+
 # Test query categories with example terms
 TEST_QUERIES = {
     "Exact Match Terms": [
@@ -122,6 +138,23 @@ def load_client_data(file_path):
     
     return data, unique_brands, unique_categories
 
+def create_indexes(collection):
+    """
+    Create the test collection indexes. The text index serves the exact word
+    search; it applies no language, so words are matched as typed, not stemmed.
+    """
+    collection.create_index([("title", "text"), ("description", "text")], default_language="none")
+    collection.create_index("brand")
+    print("✅ Created text and brand indexes")
+
+@functools.lru_cache(maxsize=1024)
+def substring_regex(text):
+    """
+    Case-insensitive BSON regex matching the text anywhere. Regex characters in
+    the text are escaped, so queries like "3+" match literally.
+    """
+    return Regex(re.escape(text), "i")
+
 def initialize_local_database(connection_string, db_name, collection_name, data):
     """Initialize local MongoDB database with the full dataset"""
     print(f"\nInitializing local MongoDB database: {db_name}.{collection_name}")
@@ -138,6 +171,8 @@ def initialize_local_database(connection_string, db_name, collection_name, data)
         
         if existing_count > 0:
             print(f"✅ Database already contains {existing_count} products. Skipping data load.")
+            # Databases loaded by earlier versions of this script may lack the text index
+            create_indexes(collection)
             return True
         
         # Load all products
@@ -173,14 +208,22 @@ def initialize_local_database(connection_string, db_name, collection_name, data)
                 product["productAttributes"] = item.get("productAttributes", {})
                 product["alternativeProductName"] = item.get("alternativeProductName", "")
                 
-                # Generate embeddings for vector search
-                product["title_embedding"] = embedding_service.generate_embedding(product["title"])
-                product["description_embedding"] = embedding_service.generate_embedding(product["description"])
-                
                 transformed_products.append(product)
             except Exception as e:
                 print(f"Error transforming product {item.get('id', 'unknown')}: {e}")
         
+        # Generate embeddings for vector search in batched model calls
+        print(f"Generating embeddings for {len(transformed_products)} products...")
+        titles = [product["title"] for product in transformed_products]
+        descriptions = [product["description"] for product in transformed_products]
+        embeddings = embedding_service.generate_embeddings(titles + descriptions)
+        for product, title_embedding, description_embedding in zip(
+            transformed_products, embeddings[:len(titles)], embeddings[len(titles):]
+        ):
+            # Store packed float32 vectors, like the ingest API does
+            product["title_embedding"] = pack_embedding(title_embedding)
+            product["description_embedding"] = pack_embedding(description_embedding)
+        
         # Insert products in batches to avoid memory issues
         batch_size = 100
         total_inserted = 0
@@ -193,11 +236,7 @@ def initialize_local_database(connection_string, db_name, collection_name, data)
         
         print(f"✅ Inserted {total_inserted} products in total")
         
-        # Create basic indexes
-        collection.create_index("title")
-        collection.create_index("description")
-        collection.create_index("brand")
-        print("✅ Created basic indexes")
+        create_indexes(collection)
         
         return True
     except Exception as e:
@@ -211,7 +250,7 @@ def initialize_local_database(connection_string, db_name, collection_name, data)
 def search_categories(db, collection, query_text, max_results=5):
     """Search for categories with exact substring matches"""
     pipeline = [
-        {"$match": {"title": {"$regex": query_text, "$options": "i"}}},
+        {"$match": {"title": substring_regex(query_text)}},
         {"$unwind": {"path": "$categories", "preserveNullAndEmptyArrays": True}},
         {"$group": {
             "_id": "$categories.id", 
@@ -243,7 +282,7 @@ def search_categories(db, collection, query_text, max_results=5):
 def search_brands(db, collection, query_text, max_results=5):
     """Search for brands with exact substring matches"""
     pipeline = [
-        {"$match": {"brand": {"$regex": query_text, "$options": "i"}}},
+        {"$match": {"brand": substring_regex(query_text)}},
         {"$group": {
             "_id": "$brand",
             "productCount": {"$sum": 1}
@@ -269,28 +308,186 @@ def search_brands(db, collection, query_text, max_results=5):
         print(f"Error searching brands: {e}")
         return []
 
+# Normalized title and description embedding matrices by collection name
+_embedding_matrices = {}
+
+def _normalized_matrix(vectors):
+    """Stack embeddings into a float32 matrix of unit-length rows; missing embeddings stay zero"""
+    matrix = np.zeros((len(vectors), EMBEDDING_DIMENSIONS), dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        if vector is not None and len(vector):
+            matrix[i] = unpack_embedding(vector)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+def load_embedding_matrices(collection):
+    """
+    Load the product embeddings of a collection once, as normalized matrices,
+    so every vector search is two matrix-vector products instead of a scan
+    over all documents with per-element Python arithmetic.
+    """
+    if collection.full_name not in _embedding_matrices:
+        ids, title_embeddings, description_embeddings = [], [], []
+        projection = {"_id": 0, "id": 1, "title_embedding": 1, "description_embedding": 1}
+        for doc in collection.find({}, projection).batch_size(1000):
+            ids.append(doc.get("id"))
+            title_embeddings.append(doc.get("title_embedding"))
+            description_embeddings.append(doc.get("description_embedding"))
+        
+        _embedding_matrices[collection.full_name] = (
+            ids,
+            _normalized_matrix(title_embeddings),
+            _normalized_matrix(description_embeddings)
+        )
+    
+    return _embedding_matrices[collection.full_name]
+
+# Whether the server supports $vectorSearch; None until the first vector query
+_vector_search_available = None
+
+def ensure_vector_search_index(collection):
+    """
+    Create the app's vector search index on the test collection and wait until
+    it can be queried. Only Atlas deployments (including local Atlas) support
+    search indexes; elsewhere the vector search falls back to local scoring.
+    """
+    global _vector_search_available
+    
+    try:
+        if not list(collection.list_search_indexes(VECTOR_INDEX_NAME)):
+            collection.create_search_index(SearchIndexModel(
+                definition=VECTOR_INDEX_DEFINITION,
+                name=VECTOR_INDEX_NAME,
+                type="vectorSearch"
+            ))
+            print(f"Creating vector search index {VECTOR_INDEX_NAME}...")
+        
+        # New indexes build asynchronously and return no results until queryable
+        deadline = time.time() + VECTOR_INDEX_READY_TIMEOUT
+        while time.time() < deadline:
+            indexes = list(collection.list_search_indexes(VECTOR_INDEX_NAME))
+            if indexes and indexes[0].get("queryable"):
+                print(f"✅ Vector search index {VECTOR_INDEX_NAME} is ready")
+                _vector_search_available = True
+                return
+            time.sleep(2)
+        print(f"⚠️ Vector search index {VECTOR_INDEX_NAME} is not ready; scoring vectors locally")
+    except OperationFailure as e:
+        print(f"Vector search is not available on this deployment ({e}); scoring vectors locally")
+    _vector_search_available = False
+
+def _vector_search_branch(embeddings, path, limit):
+    """$vectorSearch over one embedding path, scored by cosine similarity"""
+    return [
+        {
+            "$vectorSearch": {
+                "index": VECTOR_INDEX_NAME,
+                "path": path,
+                "queryVector": embeddings,
+                "numCandidates": min(limit * 20, 10000),
+                "limit": limit
+            }
+        },
+        # Atlas normalizes cosine scores to (1 + cosine) / 2
+        {"$project": {
+            **PRODUCT_PROJECTION,
+            "score": {"$subtract": [{"$multiply": [2, {"$meta": "vectorSearchScore"}]}, 1]}
+        }}
+    ]
+
+def vector_search_atlas(collection, embeddings, seen_ids, max_results):
+    """
+    Find the products most similar to the query with $vectorSearch on the
+    title and description embeddings, so only the top matches leave the server.
+    """
+    # Ask for extra candidates, since products already in other results are dropped
+    limit = max_results + len(seen_ids)
+    pipeline = _vector_search_branch(embeddings, "title_embedding", limit) + [
+        {
+            "$unionWith": {
+                "coll": collection.name,
+                "pipeline": _vector_search_branch(embeddings, "description_embedding", limit)
+            }
+        },
+        {"$match": {"id": {"$nin": list(seen_ids)}, "score": {"$gt": VECTOR_SIMILARITY_THRESHOLD}}},
+        # Use the max similarity of title and description
+        {"$sort": {"score": -1}},
+        {"$group": {"_id": "$id", "doc": {"$first": "$$ROOT"}}},
+        {"$replaceRoot": {"newRoot": "$doc"}},
+        {"$sort": {"score": -1}},
+        {"$limit": max_results}
+    ]
+    
+    results = list(collection.aggregate(pipeline))
+    for doc in results:
+        doc["matchType"] = "vector"
+    return results
+
+def vector_search_local(collection, embeddings, seen_ids, max_results):
+    """Find the products most similar to the query by scoring all embeddings in memory"""
+    results = []
+    ids, title_matrix, description_matrix = load_embedding_matrices(collection)
+    query_vector = np.asarray(embeddings, dtype=np.float32)
+    query_norm = np.linalg.norm(query_vector)
+    
+    if ids and query_norm > 0:
+        # Cosine similarity with every title and description at once; use the max
+        query_vector /= query_norm
+        similarities = np.maximum(title_matrix @ query_vector, description_matrix @ query_vector)
+        
+        # Keep the best matches above the threshold that aren't in the other results;
+        # more than max_results could never make the combined top results
+        scores = {}
+        for i in np.argsort(-similarities):
+            if similarities[i] <= VECTOR_SIMILARITY_THRESHOLD or len(scores) == max_results:
+                break
+            if ids[i] not in seen_ids:
+                scores[ids[i]] = float(similarities[i])
+        
+        # Fetch only the matched products
+        if scores:
+            for doc in collection.find({"id": {"$in": list(scores)}}, PRODUCT_PROJECTION):
+                doc["score"] = scores[doc.get("id")]
+                doc["matchType"] = "vector"
+                results.append(doc)
+    
+    return results
+
+def vector_search(collection, embeddings, seen_ids, max_results):
+    """Run the vector search on the server when possible, else locally"""
+    global _vector_search_available
+    
+    if _vector_search_available is not False:
+        try:
+            return vector_search_atlas(collection, embeddings, seen_ids, max_results)
+        except OperationFailure as e:
+            print(f"$vectorSearch failed ({e}); scoring vectors locally")
+            _vector_search_available = False
+    
+    return vector_search_local(collection, embeddings, seen_ids, max_results)
+
 def search_products_consolidated(db, collection, query_text, embeddings=None, max_results=10, include_vector_search=True):
     """Search for products using multiple strategies"""
     exact_results = []
     ngram_results = []
     vector_results = []
+    # IDs of the products already in the results, so later strategies skip them
+    seen_ids = set()
     
     # 1. Exact match search
     try:
-        exact_query = {"$or": [
-            {"title": {"$regex": f"\\b{query_text}\\b", "$options": "i"}},
-            {"description": {"$regex": f"\\b{query_text}\\b", "$options": "i"}},
-        ]}
+        # Whole words or phrase in the title or description, from the text index
+        phrase = query_text.replace('"', ' ')
+        exact_query = {"$text": {"$search": f'"{phrase}"'}}
         
-        cursor = collection.find(exact_query).limit(max_results)
+        cursor = collection.find(exact_query, PRODUCT_PROJECTION).limit(max_results)
         
         for doc in cursor:
-            if "_id" in doc:
-                del doc["_id"]
-            
             doc["score"] = 1.0
             doc["matchType"] = "exact"
             exact_results.append(doc)
+            seen_ids.add(doc.get("id"))
     except Exception as e:
         print(f"Error in exact search: {e}")
     
@@ -298,20 +495,16 @@ def search_products_consolidated(db, collection, query_text, embeddings=None, ma
     if len(query_text) >= 3:
         try:
             ngram_query = {"$or": [
-                {"title": {"$regex": query_text, "$options": "i"}},
-                {"description": {"$regex": query_text, "$options": "i"}},
+                {"title": substring_regex(query_text)},
+                {"description": substring_regex(query_text)},
             ]}
             
-            cursor = collection.find(ngram_query).limit(max_results * 2)  # Get more results to filter
+            # Get extra candidates; products already matched exactly are excluded by the server
+            ngram_query["id"] = {"$nin": list(seen_ids)}
+            cursor = collection.find(ngram_query, PRODUCT_PROJECTION).limit(max_results * 2)
             
             for doc in cursor:
-                # Skip if already in exact matches
-                if any(r.get("id") == doc.get("id") for r in exact_results):
-                    continue
-                
-                if "_id" in doc:
-                    del doc["_id"]
-                
+                seen_ids.add(doc.get("id"))
                 doc["score"] = 0.8
                 doc["matchType"] = "ngram"
                 ngram_results.append(doc)
@@ -321,43 +514,7 @@ def search_products_consolidated(db, collection, query_text, embeddings=None, ma
     # 3. Vector search for multi-word queries
     if embeddings and " " in query_text and include_vector_search:
         try:
-            # Get all products for vector comparison
-            cursor = collection.find({})
-            
-            for doc in cursor:
-                # Skip if already in other results
-                if any(r.get("id") == doc.get("id") for r in exact_results + ngram_results):
-                    continue
-                
-                if "_id" in doc:
-                    del doc["_id"]
-                
-                # Calculate similarity with title embedding
-                title_similarity = 0
-                if "title_embedding" in doc and doc["title_embedding"]:
-                    dot_product = sum(a * b for a, b in zip(embeddings, doc["title_embedding"]))
-                    magnitude1 = sum(a * a for a in embeddings) ** 0.5
-                    magnitude2 = sum(b * b for b in doc["title_embedding"]) ** 0.5
-                    if magnitude1 * magnitude2 > 0:
-                        title_similarity = dot_product / (magnitude1 * magnitude2)
-                
-                # Calculate similarity with description embedding
-                desc_similarity = 0
-                if "description_embedding" in doc and doc["description_embedding"]:
-                    dot_product = sum(a * b for a, b in zip(embeddings, doc["description_embedding"]))
-                    magnitude1 = sum(a * a for a in embeddings) ** 0.5
-                    magnitude2 = sum(b * b for b in doc["description_embedding"]) ** 0.5
-                    if magnitude1 * magnitude2 > 0:
-                        desc_similarity = dot_product / (magnitude1 * magnitude2)
-                
-                # Use max similarity
-                similarity = max(title_similarity, desc_similarity)
-                
-                # Only include if similarity is above threshold
-                if similarity > 0.5:
-                    doc["score"] = similarity
-                    doc["matchType"] = "vector"
-                    vector_results.append(doc)
+            vector_results = vector_search(collection, embeddings, seen_ids, max_results)
         except Exception as e:
             print(f"Error in vector search: {e}")
     
@@ -370,18 +527,24 @@ def search_products_consolidated(db, collection, query_text, embeddings=None, ma
     # Return top results up to limit
     return combined_results[:max_results]
 
+# Worker threads for the category and brand searches; MongoClient is thread-safe
+_search_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="consolidated-search")
+
 def consolidated_search(db, collection, query_text, max_categories=5, max_brands=5, max_products=10, include_vector_search=True):
     """Run the consolidated search with our test query"""
     start_time = time.time()
     
+    # The category and brand searches are independent round trips, so they run
+    # in the background while the query is embedded and the products searched
+    categories_future = _search_executor.submit(search_categories, db, collection, query_text, max_categories)
+    brands_future = _search_executor.submit(search_brands, db, collection, query_text, max_brands)
+    
     # Generate embeddings for vector search if needed (for multi-word queries)
     embeddings = None
     if " " in query_text and include_vector_search:
         embeddings = embedding_service.generate_embedding(query_text)
     
     # Execute consolidated search
-    categories = search_categories(db, collection, query_text, max_categories)
-    brands = search_brands(db, collection, query_text, max_brands)
     products = search_products_consolidated(
         db, 
         collection, 
@@ -390,6 +553,8 @@ def consolidated_search(db, collection, query_text, max_categories=5, max_brands
         max_products, 
         include_vector_search
     )
+    categories = categories_future.result()
+    brands = brands_future.result()
     
     # Calculate timing
     elapsed_time = time.time() - start_time
@@ -483,6 +648,9 @@ def run_all_tests(client_data, verbose=False):
         print("No products found in database")
         return
     
+    # Let vector searches run on the server where supported
+    ensure_vector_search_index(collection)
+    
     # Create results summary table
     summary_table = PrettyTable()
     summary_table.field_names = ["Category", "Query", "Categories", "Brands", "Products", "Total", "Time (s)"]
@@ -3,12 +3,31 @@ Caching service for improving performance of frequently executed queries.
 Uses a simple in-memory LRU cache with TTL (time-to-live) functionality.
 """
 
+import os
 import time
 import threading
 from collections import OrderedDict
 import hashlib
-import json
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import orjson
+
+# Canonical serialization for cache keys
+_KEY_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+def key_digest(data: Any) -> bytes:
+    """
+    Hash any data type into a 16-byte digest.
+    Dictionary keys are sorted during serialization, so dicts that differ
+    only in key order have the same digest.
+    """
+    if isinstance(data, str):
+        serialized = data.encode()
+    else:
+        # Non-JSON values (datetimes, custom objects) fall back to their string form
+        serialized = orjson.dumps(data, option=_KEY_OPTIONS, default=str)
+        
+    return hashlib.blake2b(serialized, digest_size=16).digest()
 
 class LRUCache:
     """
@@ -27,24 +46,16 @@ class LRUCache:
         self.max_size = max_size
         self.ttl_seconds = ttl_seconds
         self.cache = OrderedDict()  # {key: (value, timestamp)}
+        self.product_keys = {}  # {product_id: set of keys whose value contains the product}
+        self.key_products = {}  # {key: product_ids tagged on the entry}
         self.lock = threading.RLock()  # Reentrant lock for thread safety
     
     def _generate_key(self, data: Any) -> str:
-        """Generate a consistent hash key for any data type"""
-        if isinstance(data, dict):
-            # Sort dictionary to ensure consistent hashing regardless of key order
-            serialized = json.dumps(data, sort_keys=True)
-        elif isinstance(data, (list, tuple)):
-            # Handle lists and tuples
-            serialized = json.dumps(data)
-        elif isinstance(data, (str, int, float, bool)):
-            # Handle primitive types
-            serialized = str(data)
-        else:
-            # For other types, use string representation
-            serialized = str(data)
-            
-        return hashlib.md5(serialized.encode()).hexdigest()
+        """
+        Generate a consistent hash key for any data type.
+        Dicts that differ only in key order share one cache entry.
+        """
+        return key_digest(data).hex()
     
     def get(self, key: Any) -> Optional[Any]:
         """
@@ -67,38 +78,66 @@ class LRUCache:
             # Check if the item has expired
             if time.time() - timestamp > self.ttl_seconds:
                 # Remove expired item
-                del self.cache[hash_key]
+                self._delete(hash_key)
                 return None
                 
             # Move item to the end to indicate it was recently accessed
             self.cache.move_to_end(hash_key)
             return value
     
-    def set(self, key: Any, value: Any) -> None:
+    def set(self, key: Any, value: Any, product_ids: Optional[Iterable[str]] = None) -> None:
         """
         Add or update an item in the cache.
         
         Args:
             key: The key to store
             value: The value to cache
+            product_ids: IDs of the products contained in the value, used for
+                         targeted invalidation with invalidate_by_product()
         """
         hash_key = self._generate_key(key)
         
         with self.lock:
+            # Drop tags from a previous value stored under the same key
+            self._untag(hash_key)
+            
             # Add/update the item
             self.cache[hash_key] = (value, time.time())
             
             # Move to end to indicate it was recently accessed
             self.cache.move_to_end(hash_key)
             
+            if product_ids:
+                tagged = tuple(set(pid for pid in product_ids if pid is not None))
+                self.key_products[hash_key] = tagged
+                for pid in tagged:
+                    self.product_keys.setdefault(pid, set()).add(hash_key)
+            
             # Remove oldest items if cache is too large
             while len(self.cache) > self.max_size:
-                self.cache.popitem(last=False)
+                oldest_key, _ = self.cache.popitem(last=False)
+                self._untag(oldest_key)
+    
+    def _untag(self, hash_key: str) -> None:
+        """Remove the product tags of a cache entry (caller must hold the lock)"""
+        for pid in self.key_products.pop(hash_key, ()):
+            keys = self.product_keys.get(pid)
+            if keys is not None:
+                keys.discard(hash_key)
+                if not keys:
+                    del self.product_keys[pid]
+    
+    def _delete(self, hash_key: str) -> None:
+        """Delete a cache entry and its product tags (caller must hold the lock)"""
+        del self.cache[hash_key]
+        self._untag(hash_key)
     
     def clear(self) -> None:
         """Clear all cached items"""
         with self.lock:
             self.cache.clear()
+            self.product_keys.clear()
+            self.key_products.clear()
     
     def remove(self, key: Any) -> None:
         """Remove a specific item from the cache"""
@@ -106,7 +145,22 @@ class LRUCache:
         
         with self.lock:
             if hash_key in self.cache:
-                del self.cache[hash_key]
+                self._delete(hash_key)
+    
+    def invalidate_by_product(self, product_id: str) -> int:
+        """
+        Remove all items whose cached value contains the given product.
+        
+        Returns:
+            Number of items removed
+        """
+        with self.lock:
+            hash_keys = self.product_keys.pop(product_id, set())
+            for hash_key in hash_keys:
+                if hash_key in self.cache:
+                    self._delete(hash_key)
+                
+        return len(hash_keys)
     
     def remove_pattern(self, pattern: str) -> int:
         """
@@ -123,7 +177,7 @@ class LRUCache:
             
             # Remove matching keys
             for k in keys_to_remove:
-                del self.cache[k]
+                self._delete(k)
                 removed_count += 1
                 
         return removed_count
@@ -139,6 +193,10 @@ class LRUCache:
 
 # Global cache instances
 # Different caches for different types of data with appropriate sizes and TTL values
-search_cache = LRUCache(max_size=500, ttl_seconds=300)  # 5 minutes for search results
+search_cache = LRUCache(max_size=500, ttl_seconds=300)  # 5 minutes for search results, stored as encoded JSON
 product_cache = LRUCache(max_size=1000, ttl_seconds=3600)  # 1 hour for product details
 recommendations_cache = LRUCache(max_size=200, ttl_seconds=1800)  # 30 minutes for recommendations
+embedding_cache = LRUCache(
+    max_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+    ttl_seconds=int(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+)  # 1 hour for text embeddings, stored as float32 arrays (~1.5 KB each)
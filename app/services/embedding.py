@@ -1,26 +1,98 @@
 import os
+import asyncio
 import numpy as np
 import random
+from concurrent.futures import ThreadPoolExecutor
+
+from services.cache import embedding_cache
 
 # Only import heavy ML dependencies if not in test mode
 TEST_MODE = os.environ.get("TEST_MODE", "false").lower() in ("true", "1", "yes")
 
+# Inference device: "auto" uses the best available accelerator, "gpu" expects one, "cpu" forces the CPU
+EMBEDDING_GPU_MODE = os.environ.get("EMBEDDING_GPU_MODE", "auto").lower()
+
+# Batch size to retry with after the GPU runs out of memory
+OOM_FALLBACK_BATCH_SIZE = 8
+
+def _select_device() -> str:
+    """Pick the inference device according to EMBEDDING_GPU_MODE"""
+    if EMBEDDING_GPU_MODE == "cpu":
+        return "cpu"
+    
+    # CUDA (and ROCm builds of torch, which report through torch.cuda) first, then Apple MPS
+    if torch.cuda.is_available():
+        return "cuda"
+    mps = getattr(torch.backends, "mps", None)
+    if mps is not None and mps.is_available():
+        return "mps"
+    
+    if EMBEDDING_GPU_MODE == "gpu":
+        print("WARNING: EMBEDDING_GPU_MODE=gpu but no GPU is available, falling back to CPU")
+    return "cpu"
+
 if not TEST_MODE:
     try:
         from sentence_transformers import SentenceTransformer
         import torch
-        # Check if CUDA is available for GPU acceleration
-        device = "cuda" if torch.cuda.is_available() else "cpu"
+        # Check if a GPU is available for acceleration
+        device = _select_device()
     except ImportError:
         print("WARNING: sentence-transformers not available, falling back to test mode")
         TEST_MODE = True
 
+# Multilingual model used for all embeddings
+EMBEDDING_MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+
+# Default embedding size for the MiniLM-L12-v2 model
+EMBEDDING_DIMENSIONS = 384
+
+# Maximum number of texts encoded in one forward pass
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "64"))
+
+# Weight quantization applied to the model on CPU: "int8" or "none".
+# Ingestion and search share this service, so stored and query vectors always match.
+EMBEDDING_QUANTIZATION = os.environ.get("EMBEDDING_QUANTIZATION", "int8").lower()
+
+# Dynamic batching of concurrent query embeddings: wait up to the window for
+# more queries to arrive, and encode at most QUERY_MAX_BATCH of them together
+QUERY_BATCH_WINDOW_MS = float(os.environ.get("EMBEDDING_QUERY_BATCH_WINDOW_MS", "8"))
+QUERY_MAX_BATCH = int(os.environ.get("EMBEDDING_QUERY_MAX_BATCH", "32"))
+
+# Single worker thread for model inference; torch releases the GIL while encoding,
+# so running it here keeps the event loop free without loading the model twice
+_inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+
+def _load_model(device: str):
+    """Load the embedding model on the given device"""
+    # Load the multilingual model specified in requirements
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
+    
+    # Dynamic INT8 quantization of the linear layers roughly halves CPU inference time
+    if device == "cpu" and EMBEDDING_QUANTIZATION == "int8":
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        print("Model quantized to INT8")
+    return model
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize search query text into a cache key.
+    Queries are matched case-insensitively, so "Nike Shoes " and "nike shoes"
+    are treated as the same query. Only the key is lowercased; the model is
+    cased, so it embeds the query as typed, like product texts.
+    """
+    return " ".join(text.lower().split())
+
 class EmbeddingService:
     """
     Service for generating embeddings using the sentence-transformers library.
     Uses the paraphrase-multilingual-MiniLM-L12-v2 model which is good for Norwegian and Swedish.
     """
     _instance = None
+    _query_queue = None
+    _query_pending = None  # {normalized query: future of its embedding}
+    _query_loop = None
+    _query_batcher_task = None
     
     def __new__(cls):
         """Singleton pattern to ensure we only load the model once"""
@@ -33,8 +105,15 @@ class EmbeddingService:
             else:
                 print(f"Initializing embedding model on {device}...")
                 try:
-                    # Load the multilingual model specified in requirements
-                    cls._instance.model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2', device=device)
+                    try:
+                        cls._instance.model = _load_model(device)
+                    except Exception as e:
+                        if device == "cpu":
+                            raise
+                        # A broken GPU setup should cost speed, not embeddings
+                        print(f"Failed to load embedding model on {device}: {e}")
+                        print("Falling back to CPU")
+                        cls._instance.model = _load_model("cpu")
                     print("Model loaded successfully")
                 except Exception as e:
                     print(f"Failed to load embedding model: {e}")
@@ -50,8 +129,7 @@ class EmbeddingService:
         Generate embedding vector for the provided text.
         Returns the embedding as a list (for MongoDB storage compatibility).
         """
-        # Default embedding size for the MiniLM-L12-v2 model
-        embedding_size = 384
+        embedding_size = EMBEDDING_DIMENSIONS
         
         if not text:
             return [0.0] * embedding_size  # Return zero vector for empty text
@@ -62,15 +140,167 @@ class EmbeddingService:
             random.seed(hash(text) % 10000)
             embedding = [random.uniform(-1, 1) for _ in range(embedding_size)]
             return embedding
+        
+        # Repeated texts (popular queries, unchanged titles) skip the model entirely
+        cached = embedding_cache.get(text)
+        if cached is not None:
+            return cached.tolist()
             
         # Generate embedding using the actual model
-        embedding = self.model.encode(text)
+        embedding = np.asarray(self.model.encode(text), dtype=np.float32)
+        embedding_cache.set(text, embedding)
         
         # Convert to list for JSON serialization
-        if isinstance(embedding, np.ndarray):
-            embedding = embedding.tolist()
+        return embedding.tolist()
+    
+    def generate_embeddings(self, texts: list, batch_size: int = EMBEDDING_BATCH_SIZE) -> list:
+        """
+        Generate embedding vectors for a list of texts with batched model calls.
+        The result is aligned with the input; empty texts get a zero vector.
+        """
+        embedding_size = EMBEDDING_DIMENSIONS
+        
+        if not texts:
+            return []
+        
+        if TEST_MODE or getattr(EmbeddingService, '_test_mode', False):
+            return [self.generate_embedding(text) for text in texts]
+        
+        embeddings = [[0.0] * embedding_size for _ in texts]
+        
+        # Take cached embeddings where available and collect the distinct misses
+        missing = {}
+        for i, text in enumerate(texts):
+            if not text:
+                continue
+            cached = embedding_cache.get(text)
+            if cached is not None:
+                embeddings[i] = cached.tolist()
+            else:
+                missing.setdefault(text, []).append(i)
+        
+        # Encode all missing texts together, batch_size texts per forward pass
+        if missing:
+            missing_texts = list(missing)
+            try:
+                encoded = self.model.encode(missing_texts, batch_size=batch_size)
+            except torch.cuda.OutOfMemoryError:
+                torch.cuda.empty_cache()
+                print(f"GPU out of memory at batch size {batch_size}, retrying with {OOM_FALLBACK_BATCH_SIZE}")
+                encoded = self.model.encode(missing_texts, batch_size=OOM_FALLBACK_BATCH_SIZE)
+            encoded = np.asarray(encoded, dtype=np.float32)
+            
+            for text, embedding in zip(missing_texts, encoded):
+                embedding_cache.set(text, embedding)
+                # Convert to list for JSON serialization
+                embedding_list = embedding.tolist()
+                for i in missing[text]:
+                    embeddings[i] = embedding_list
+        
+        return embeddings
+    
+    async def generate_embeddings_async(self, texts: list) -> list:
+        """
+        Generate embeddings for a list of texts on the inference thread,
+        so large batches don't block the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_inference_executor, self.generate_embeddings, texts)
+    
+    async def embed_query(self, text: str) -> list:
+        """
+        Generate the embedding for a search query.
+        Queries arriving within a few milliseconds of each other are encoded
+        together in one forward pass by the background batcher.
+        Case and whitespace variants of the same query share one cache entry
+        and one forward pass; the model gets the first variant's original case.
+        """
+        key = normalize_query(text)
+        cached = embedding_cache.get(key) if key else None
+        if cached is not None:
+            return cached.tolist()
+        # Collapse whitespace only; lowercasing would change the embedding
+        text = " ".join(text.split())
+        
+        loop = asyncio.get_running_loop()
+        
+        # Start the batcher on first use (and again if the event loop changed)
+        if self._query_loop is not loop:
+            self._query_queue = asyncio.Queue()
+            self._query_pending = {}
+            self._query_loop = loop
+            # Keep a reference: the event loop only holds tasks weakly
+            self._query_batcher_task = loop.create_task(self._run_query_batcher(self._query_queue))
+            self._query_batcher_task.add_done_callback(self._on_query_batcher_done)
+        
+        # Identical queries that arrive while one is queued or being encoded
+        # wait for that result instead of running the model again
+        future = self._query_pending.get(key)
+        if future is None:
+            future = loop.create_future()
+            pending = self._query_pending
+            pending[key] = future
+            # Bound to this dict, which is replaced if the batcher is restarted
+            future.add_done_callback(lambda _: pending.pop(key, None))
+            self._query_queue.put_nowait((key, text, future))
+        
+        # Shielded so a cancelled request does not cancel the shared result
+        return await asyncio.shield(future)
+    
+    def _on_query_batcher_done(self, task: asyncio.Task):
+        """
+        Log a batcher that stopped and reset its state, so the next query
+        starts a new batcher instead of waiting on a queue nobody drains.
+        """
+        # A batcher replaced after an event loop change is not the current one
+        if task is not self._query_batcher_task:
+            return
+        
+        error = None if task.cancelled() else task.exception()
+        print(f"Query embedding batcher stopped: {error!r}")
+        
+        # Fail the queries still waiting on this batcher rather than leaving them hanging
+        for future in list(self._query_pending.values()):
+            if not future.done():
+                future.set_exception(error or RuntimeError("Query embedding batcher stopped"))
+        
+        self._query_queue = None
+        self._query_pending = None
+        self._query_loop = None
+        self._query_batcher_task = None
+    
+    async def _run_query_batcher(self, queue: asyncio.Queue):
+        """Drain queued queries in batches and resolve their futures"""
+        loop = asyncio.get_running_loop()
+        window = QUERY_BATCH_WINDOW_MS / 1000
+        
+        while True:
+            # Wait for the first query, then collect more until the window closes
+            batch = [await queue.get()]
+            deadline = loop.time() + window
+            while len(batch) < QUERY_MAX_BATCH:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                embeddings = await self.generate_embeddings_async([text for _, text, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
             
-        return embedding
+            for (key, _, future), embedding in zip(batch, embeddings):
+                # Cache under the normalized key so every variant of the query hits
+                if key:
+                    embedding_cache.set(key, np.asarray(embedding, dtype=np.float32))
+                if not future.done():
+                    future.set_result(embedding)
     
     def batch_encode(self, texts: list) -> list:
         """
@@ -19,8 +19,8 @@ class APIMonitoringMiddleware(BaseHTTPMiddleware):
     """
     
     async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # Start timer
-        start_time = time.time()
+        # Start timer (monotonic, high resolution)
+        start_time = time.perf_counter()
         
         # Get request details
         method = request.method
@@ -33,7 +33,7 @@ class APIMonitoringMiddleware(BaseHTTPMiddleware):
             response = await call_next(request)
             
             # Calculate processing time
-            process_time = time.time() - start_time
+            process_time = time.perf_counter() - start_time
             
             # Log successful request
             logger.info(
@@ -42,13 +42,13 @@ class APIMonitoringMiddleware(BaseHTTPMiddleware):
             )
             
             # Add processing time header
-            response.headers["X-Process-Time"] = str(process_time)
+            response.headers["X-Process-Time"] = f"{process_time:.6f}"
             
             return response
             
         except Exception as e:
             # Calculate processing time for failed request
-            process_time = time.time() - start_time
+            process_time = time.perf_counter() - start_time
             
             # Log error
             logger.error(
@@ -9,6 +9,8 @@ from pymongo.database import Database
 from pymongo.collection import Collection
 import asyncio
 
+from database.mongodb import NO_EMBEDDING_PROJECTION
+
 class NaiveRecommender:
     """
     Implementation of a naive product recommendation system
@@ -38,7 +40,8 @@ class NaiveRecommender:
         Returns:
             Statistics about the computation
         """
-        start_count = await self.product_pairs_collection.count_documents({})
+        # Unfiltered count from collection metadata, without scanning the pairs
+        start_count = await self.product_pairs_collection.estimated_document_count()
         
         # Clear existing pairs
         await self.product_pairs_collection.delete_many({})
@@ -93,8 +96,8 @@ class NaiveRecommender:
         if product_pairs:
             await self.product_pairs_collection.insert_many(product_pairs)
         
-        # Get final count
-        end_count = await self.product_pairs_collection.count_documents({})
+        # The collection was emptied first, so the final count is the number of pairs inserted
+        end_count = len(product_pairs)
         
         return {
             "previous_count": start_count,
@@ -197,7 +200,9 @@ class NaiveRecommender:
             List of recommended products
         """
         # First get the product details
-        product = await self.products_collection.find_one({"id": product_id})
+        product = await self.products_collection.find_one(
+            {"id": product_id}, {"_id": 0, "title": 1, "description": 1, "brand": 1}
+        )
         if not product:
             return []
         
@@ -235,7 +240,9 @@ class NaiveRecommender:
             # Exclude the original product
             {"$match": {"id": {"$ne": product_id}}},
             # Limit results
-            {"$limit": limit}
+            {"$limit": limit},
+            # Leave _id and embedding vectors on the server
+            {"$project": NO_EMBEDDING_PROJECTION}
         ]
         
         # Execute the pipeline
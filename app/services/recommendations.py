@@ -13,6 +13,8 @@ from pymongo.collection import Collection
 
 from services.embedding import embedding_service
 from services.cache import recommendations_cache
+from database.mongodb import NO_EMBEDDING_PROJECTION, VECTOR_INDEX_NAME
+from utils.vectors import unpack_embedding
 
 class RecommendationEngine:
     """
@@ -66,22 +68,15 @@ class RecommendationEngine:
             {"$limit": limit}
         ]
         
-        similar_products_cursor = orderlines_collection.aggregate(pipeline)
-        similar_product_ids = [item["_id"] async for item in similar_products_cursor]
+        similar_products = await orderlines_collection.aggregate(pipeline).to_list(limit)
+        similar_product_ids = [item["_id"] for item in similar_products]
         
         # Fetch product details for the recommended products
         recommended_products = []
         if similar_product_ids:
-            cursor = product_collection.find({"id": {"$in": similar_product_ids}})
-            async for product in cursor:
-                # Remove MongoDB _id and embedding vectors from response
-                if "_id" in product:
-                    del product["_id"]
-                if "title_embedding" in product:
-                    del product["title_embedding"]
-                if "description_embedding" in product:
-                    del product["description_embedding"]
-                recommended_products.append(product)
+            recommended_products = await product_collection.find(
+                {"id": {"$in": similar_product_ids}}, NO_EMBEDDING_PROJECTION
+            ).to_list(len(similar_product_ids))
         
         # Cache results
         recommendations_cache.set(cache_key, recommended_products)
@@ -112,7 +107,9 @@ class RecommendationEngine:
             return cached_result
         
         # Get source product
-        source_product = await product_collection.find_one({"id": product_id})
+        source_product = await product_collection.find_one(
+            {"id": product_id}, {"_id": 0, "title_embedding": 1, "description_embedding": 1}
+        )
         if not source_product:
             return []
             
@@ -123,33 +120,26 @@ class RecommendationEngine:
         if not title_embedding or not description_embedding:
             return []
         
+        # Stored embeddings are packed float32 vectors; the query needs a list
+        title_embedding = unpack_embedding(title_embedding).tolist()
+        
         # Find similar products using vector search
         pipeline = [
             {
-                "$search": {
-                    "index": "product_search",
-                    "knnBeta": {
-                        "vector": title_embedding,
-                        "path": "title_embedding",
-                        "k": limit + 1,  # +1 because we'll exclude the source product
-                    }
+                "$vectorSearch": {
+                    "index": VECTOR_INDEX_NAME,
+                    "path": "title_embedding",
+                    "queryVector": title_embedding,
+                    "numCandidates": (limit + 1) * 20,
+                    "limit": limit + 1  # +1 because we'll exclude the source product
                 }
             },
             {"$match": {"id": {"$ne": product_id}}},  # Exclude the source product
-            {"$limit": limit}
+            {"$limit": limit},
+            {"$project": NO_EMBEDDING_PROJECTION}  # Leave _id and embedding vectors on the server
         ]
         
-        similar_products = []
-        cursor = product_collection.aggregate(pipeline)
-        async for product in cursor:
-            # Remove MongoDB _id and embedding vectors from response
-            if "_id" in product:
-                del product["_id"]
-            if "title_embedding" in product:
-                del product["title_embedding"]
-            if "description_embedding" in product:
-                del product["description_embedding"]
-            similar_products.append(product)
+        similar_products = await product_collection.aggregate(pipeline).to_list(limit)
         
         # Cache results
         recommendations_cache.set(cache_key, similar_products)
@@ -0,0 +1,194 @@
+"""
+Semantic caching of search responses.
+Near-duplicate queries ("baby shoes", "shoes for baby") have almost identical
+embeddings, so a response cached for one query can be reused for the other
+without running the Atlas search again.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from services.cache import key_digest
+from services.embedding import EMBEDDING_DIMENSIONS
+
+class SemanticCache:
+    """
+    Thread-safe LRU cache of responses keyed by query embedding.
+    A lookup hits when a stored embedding with the same context (the other
+    request parameters, such as filters and paging) has a cosine similarity
+    of at least the threshold. Embeddings are held in one preallocated matrix,
+    so a lookup is a single matrix-vector product over all entries.
+    """
+
+    def __init__(self, dim: int, max_size: int = 10000, threshold: float = 0.97, ttl_seconds: int = 300):
+        """
+        Initialize the semantic cache.
+
+        Args:
+            dim: Dimension of the query embeddings
+            max_size: Maximum number of responses to store in the cache
+            threshold: Minimum cosine similarity for a cache hit
+            ttl_seconds: Time-to-live for cached responses in seconds
+        """
+        self.dim = dim
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.vectors = np.zeros((max_size, dim), dtype=np.float32)  # Unit-length embeddings by slot
+        self.contexts = np.zeros(max_size, dtype=np.int64)  # Context hash by slot
+        self.timestamps = np.zeros(max_size, dtype=np.float64)  # Store time by slot
+        self.occupied = np.zeros(max_size, dtype=bool)
+        self.values: List[Any] = [None] * max_size
+        self.slots = OrderedDict()  # {slot: None}, least recently used first
+        self.product_slots = {}  # {product_id: set of slots whose value contains the product}
+        self.slot_products = {}  # {slot: product_ids tagged on the entry}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def _context_hash(self, context: Optional[Dict[str, Any]]) -> int:
+        """Hash the non-query request parameters into a signed 64-bit integer"""
+        # Same canonical serialization and hash as the LRU cache keys
+        return int.from_bytes(key_digest(context or {})[:8], "little", signed=True)
+
+    def _normalize(self, embedding: Iterable[float]) -> Optional[np.ndarray]:
+        """Convert an embedding to a unit-length float32 vector"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if vector.shape != (self.dim,) or norm == 0:
+            return None
+        return vector / norm
+
+    def lookup(self, embedding: Iterable[float], context: Optional[Dict[str, Any]] = None) -> Optional[Any]:
+        """
+        Get the response cached for the most similar query.
+
+        Args:
+            embedding: Embedding of the incoming query
+            context: Other request parameters that must match exactly
+
+        Returns:
+            The cached response or None if no stored query is similar enough
+        """
+        vector = self._normalize(embedding)
+        if vector is None:
+            return None
+        context_hash = self._context_hash(context)
+
+        with self.lock:
+            candidates = self.occupied & (self.contexts == context_hash)
+            candidates &= time.time() - self.timestamps <= self.ttl_seconds
+            if not candidates.any():
+                self.misses += 1
+                return None
+
+            similarities = np.where(candidates, self.vectors @ vector, -np.inf)
+            slot = int(np.argmax(similarities))
+            if similarities[slot] < self.threshold:
+                self.misses += 1
+                return None
+
+            # Mark the entry as recently used
+            self.slots.move_to_end(slot)
+            self.hits += 1
+            return self.values[slot]
+
+    def store(self, embedding: Iterable[float], value: Any, context: Optional[Dict[str, Any]] = None,
+              product_ids: Optional[Iterable[str]] = None) -> None:
+        """
+        Add a response to the cache.
+
+        Args:
+            embedding: Embedding of the query the response was computed for
+            value: The response to cache
+            context: Other request parameters the response depends on
+            product_ids: IDs of the products contained in the value, used for
+                         targeted invalidation with invalidate_by_product()
+        """
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+        context_hash = self._context_hash(context)
+
+        with self.lock:
+            # Reuse a free slot, or evict the least recently used entry
+            if len(self.slots) < self.max_size:
+                slot = len(self.slots)
+                while self.occupied[slot]:
+                    slot = (slot + 1) % self.max_size
+            else:
+                slot, _ = self.slots.popitem(last=False)
+                self._free(slot)
+
+            self.vectors[slot] = vector
+            self.contexts[slot] = context_hash
+            self.timestamps[slot] = time.time()
+            self.occupied[slot] = True
+            self.values[slot] = value
+            self.slots[slot] = None
+
+            if product_ids:
+                tagged = tuple(set(pid for pid in product_ids if pid is not None))
+                self.slot_products[slot] = tagged
+                for pid in tagged:
+                    self.product_slots.setdefault(pid, set()).add(slot)
+
+    def _free(self, slot: int) -> None:
+        """Release a slot and its product tags (caller must hold the lock)"""
+        self.occupied[slot] = False
+        self.values[slot] = None
+        self.slots.pop(slot, None)
+        for pid in self.slot_products.pop(slot, ()):
+            slots = self.product_slots.get(pid)
+            if slots is not None:
+                slots.discard(slot)
+                if not slots:
+                    del self.product_slots[pid]
+
+    def invalidate_by_product(self, product_id: str) -> int:
+        """
+        Remove all responses that contain the given product.
+
+        Returns:
+            Number of responses removed
+        """
+        with self.lock:
+            slots = list(self.product_slots.get(product_id, ()))
+            for slot in slots:
+                self._free(slot)
+
+        return len(slots)
+
+    def clear(self) -> None:
+        """Clear all cached responses"""
+        with self.lock:
+            self.occupied[:] = False
+            self.values = [None] * self.max_size
+            self.slots.clear()
+            self.product_slots.clear()
+            self.slot_products.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        with self.lock:
+            return {
+                "size": len(self.slots),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+# Global semantic cache for search responses
+semantic_search_cache = SemanticCache(
+    dim=EMBEDDING_DIMENSIONS,
+    max_size=int(os.getenv("SEMANTIC_CACHE_SIZE", "10000")),
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97")),
+    ttl_seconds=int(os.getenv("SEMANTIC_CACHE_TTL", "300"))
+)
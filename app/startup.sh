@@ -33,4 +33,4 @@ ls -la
 
 # Start the API server
 echo "Starting the API server..."
-exec uvicorn main:app --host 0.0.0.0 --port 8000
+exec uvicorn main:app --host 0.0.0.0 --port 8000 --loop uvloop --http httptools --workers "${WEB_CONCURRENCY:-1}"
@@ -12,6 +12,7 @@ sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
 
 # Import mock database module
 from tests.mock_db import get_mock_db_patch
+from database.mongodb import db
 
 # Mock environment variables for testing
 os.environ["MONGODB_URI"] = "mongodb://localhost:27017/test_db"
@@ -22,6 +23,8 @@ TEST_API_KEY = "test_api_key"
 @pytest.fixture(scope="session", autouse=True)
 def mock_mongodb():
     """Apply mock database patches for all tests"""
+    # Start from a mock connection so nothing falls through to a real client
+    db.initialize_for_testing()
     patches = get_mock_db_patch()
     
     # Start all patches
@@ -70,12 +73,19 @@ def test_client():
     from main import app
     
     # Override API key dependency for testing
-    with patch("dependencies.API_KEY", TEST_API_KEY):
+    with patch("dependencies._API_KEY_BYTES", TEST_API_KEY.encode()):
         client = TestClient(app)
         yield client
 
 @pytest.fixture(autouse=True)
 def override_dependencies():
     """Override dependencies for testing"""
-    with patch("dependencies.API_KEY", TEST_API_KEY):
+    with patch("dependencies._API_KEY_BYTES", TEST_API_KEY.encode()):
         yield
+
+@pytest.fixture(autouse=True)
+def clear_semantic_cache():
+    """Start every test with an empty semantic cache; mocked embeddings are identical across queries"""
+    from services.semantic_cache import semantic_search_cache
+    semantic_search_cache.clear()
+    yield
@@ -61,6 +61,10 @@ class MockCollection:
         # Update one
         self.update_one = AsyncMock()
         self.update_one.return_value = MagicMock(modified_count=1)
+        
+        # Bulk write
+        self.bulk_write = AsyncMock()
+        self.bulk_write.return_value = MagicMock(upserted_count=1, matched_count=0, deleted_count=0)
 
 
 class MockDatabase:
@@ -140,7 +144,10 @@ def get_mock_db_patch():
     patches = [
         patch("database.mongodb.db.client", mock_client),
         patch("database.mongodb.db.db", mock_db),
-        patch("database.mongodb.get_db", return_value=mock_db)
+        patch("database.mongodb.get_db", return_value=mock_db),
+        patch("database.mongodb.products_collection", mock_db.products),
+        patch("database.mongodb.orderlines_collection", mock_db.orderlines),
+        patch("database.mongodb.product_pairs_collection", mock_db.product_pairs)
     ]
     
     return patches
@@ -45,9 +45,6 @@ def run_health_endpoint_test():
             # Now import the app with mocks in place
             from main import app
             
-            # Set testing environment variable
-            os.environ["TESTING"] = "true"
-            
             # Create test client - use proper initialization for FastAPI
             from starlette.testclient import TestClient
             client = TestClient(app=app)
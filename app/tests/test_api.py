@@ -2,7 +2,8 @@ import os
 import sys
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, AsyncMock, patch
+from pymongo import ReplaceOne
 import json
 
 # Add parent directory to path to import app modules
@@ -48,7 +49,7 @@ sample_orderline = {
 # Override API key dependency for testing
 @pytest.fixture(autouse=True)
 def override_dependencies():
-    with patch("dependencies.API_KEY", TEST_API_KEY):
+    with patch("dependencies._API_KEY_BYTES", TEST_API_KEY.encode()):
         yield
 
 # Tests
@@ -63,12 +64,12 @@ def test_product_ingestion():
     # Mock database operations
     with patch("routers.products.get_product_collection") as mock_get_collection:
         mock_collection = Mock()
-        mock_collection.replace_one.return_value = Mock(upserted_id="test1")
+        mock_collection.bulk_write = AsyncMock(return_value=Mock(upserted_count=1, matched_count=0, deleted_count=0))
         mock_get_collection.return_value = mock_collection
         
         # Also mock embedding service
-        with patch("services.embedding.embedding_service.generate_embedding") as mock_embedding:
-            mock_embedding.return_value = [0.1] * 384  # Dummy embedding vector
+        with patch("services.embedding.embedding_service.generate_embeddings") as mock_embedding:
+            mock_embedding.side_effect = lambda texts: [[0.1] * 384 for _ in texts]  # Dummy embedding vectors
             
             response = client.post(
                 "/ingestProducts",
@@ -77,7 +78,14 @@ def test_product_ingestion():
             )
             
             assert response.status_code == 201
-            assert "test1" in response.json()
+            assert response.json() == ["test1"]
+            
+            # The product is written as one upsert in an unordered bulk write
+            operations = mock_collection.bulk_write.call_args.args[0]
+            assert len(operations) == 1
+            assert isinstance(operations[0], ReplaceOne)
+            assert operations[0]._filter == {"id": "test1"}
+            assert operations[0]._upsert is True
 
 def test_orderline_ingestion():
     """Test orderline ingestion endpoint"""
@@ -104,12 +112,12 @@ def test_search_endpoint():
         mock_collection = Mock()
         # Mock the aggregate cursor
         mock_cursor = Mock()
-        mock_cursor.__aiter__.return_value = [sample_product]
+        mock_cursor.to_list = AsyncMock(return_value=[{"results": [sample_product], "total": [{"count": 1}]}])
         mock_collection.aggregate.return_value = mock_cursor
         mock_get_collection.return_value = mock_collection
         
         # Mock embedding service
-        with patch("services.embedding.embedding_service.generate_embedding") as mock_embedding:
+        with patch("services.embedding.embedding_service.embed_query", new_callable=AsyncMock) as mock_embedding:
             mock_embedding.return_value = [0.1] * 384  # Dummy embedding vector
             
             response = client.post(
@@ -0,0 +1,55 @@
+"""
+Test module for the in-memory LRU cache service
+"""
+import pytest
+
+from services.cache import LRUCache
+
+
+def test_invalidate_by_product_removes_only_tagged_entries():
+    """Test that invalidating a product only drops entries that contained it"""
+    cache = LRUCache(max_size=10, ttl_seconds=60)
+    cache.set("search:shoes", {"products": ["prod1", "prod2"]}, product_ids=["prod1", "prod2"])
+    cache.set("search:hats", {"products": ["prod3"]}, product_ids=["prod3"])
+
+    removed = cache.invalidate_by_product("prod1")
+
+    assert removed == 1
+    assert cache.get("search:shoes") is None
+    assert cache.get("search:hats") == {"products": ["prod3"]}
+
+
+def test_invalidate_by_product_after_eviction():
+    """Test that evicted entries do not leave stale product tags behind"""
+    cache = LRUCache(max_size=1, ttl_seconds=60)
+    cache.set("search:shoes", ["prod1"], product_ids=["prod1"])
+    cache.set("search:hats", ["prod3"], product_ids=["prod3"])
+
+    assert "prod1" not in cache.product_keys
+    assert cache.invalidate_by_product("prod1") == 0
+    assert cache.get("search:hats") == ["prod3"]
+
+
+def test_clear_resets_product_tags():
+    """Test that clearing the cache also drops all product tags"""
+    cache = LRUCache(max_size=10, ttl_seconds=60)
+    cache.set("search:shoes", ["prod1"], product_ids=["prod1"])
+
+    cache.clear()
+
+    assert cache.get_stats()["size"] == 0
+    assert cache.product_keys == {}
+    assert cache.key_products == {}
+
+
+def test_dict_keys_ignore_key_order():
+    """Test that dict keys differing only in key order hit the same entry"""
+    cache = LRUCache(max_size=10, ttl_seconds=60)
+    cache.set({"query": "shoes", "filters": {"color": "blue", "brand": "x"}}, ["prod1"])
+
+    assert cache.get({"filters": {"brand": "x", "color": "blue"}, "query": "shoes"}) == ["prod1"]
+    assert cache.get({"query": "shoes", "filters": {"color": "red", "brand": "x"}}) is None
+
+
+if __name__ == "__main__":
+    pytest.main(["-xvs", __file__])
@@ -1,7 +1,7 @@
 import pytest
 from fastapi.testclient import TestClient
 import json
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock, ANY
 import os
 import sys
 
@@ -11,6 +11,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from main import app
 from services.embedding import embedding_service
 from models.product import CategoryResult, BrandResult
+from routers.search import search_consolidated, categories_pipeline
+from database.mongodb import CASE_INSENSITIVE_COLLATION
 
 client = TestClient(app)
 
@@ -54,20 +56,14 @@ sample_products = [
 # Mock async functions
 @pytest.fixture
 def mock_search_functions():
-    with patch("routers.search.search_categories") as mock_categories, \
-         patch("routers.search.search_brands") as mock_brands, \
-         patch("routers.search.search_products_consolidated") as mock_products, \
-         patch("services.embedding.embedding_service.generate_embedding") as mock_embedding:
+    with patch("routers.search.search_consolidated", new_callable=AsyncMock) as mock_search, \
+         patch("services.embedding.embedding_service.embed_query", new_callable=AsyncMock) as mock_embedding:
         
-        mock_categories.return_value = sample_categories
-        mock_brands.return_value = sample_brands
-        mock_products.return_value = sample_products
+        mock_search.return_value = (sample_categories, sample_brands, sample_products)
         mock_embedding.return_value = [0.1] * 384  # Mock 384-dimensional vector
         
         yield {
-            "categories": mock_categories,
-            "brands": mock_brands,
-            "products": mock_products,
+            "search": mock_search,
             "embedding": mock_embedding
         }
 
@@ -173,24 +169,50 @@ async def test_consolidated_search_partial_word_matching(mock_search_functions):
         # Even with partial match, we should get results
         assert len(result["products"]) > 0
         
-        # The search functions should have been called with the partial query
-        mock_search_functions["categories"].assert_called_with(
-            app.mongodb, 
-            app.mongodb.products, 
-            partial, 
-            2
-        )
-        mock_search_functions["brands"].assert_called_with(
-            app.mongodb, 
-            app.mongodb.products, 
-            partial, 
-            2
-        )
-        mock_search_functions["products"].assert_called_with(
-            app.mongodb, 
-            app.mongodb.products, 
-            partial, 
-            mock_search_functions["embedding"].return_value, 
+        # The consolidated search should have been called with the partial query
+        mock_search_functions["search"].assert_called_with(
+            ANY,
+            partial,
+            None,  # Single-word queries are not embedded
+            2,
+            2,
             5,
             True
         )
+
+def _mock_cursor(rows=None, error=None):
+    cursor = MagicMock()
+    cursor.to_list = AsyncMock(return_value=rows, side_effect=error)
+    return cursor
+
+@pytest.mark.asyncio
+async def test_search_consolidated_isolates_failing_branch():
+    """Test that an error in one branch only empties that branch"""
+    def aggregate(pipeline, **kwargs):
+        if "$search" in pipeline[0]:
+            return _mock_cursor(error=Exception("index product_search not found"))
+        if "collation" in kwargs:
+            return _mock_cursor([{"id": "MetalTech", "name": "MetalTech", "productCount": 3}])
+        return _mock_cursor([{"id": "cat1", "name": "Metal Detectors", "slug": "metal-detectors", "productCount": 5}])
+    
+    collection = MagicMock()
+    collection.name = "products"
+    collection.aggregate.side_effect = aggregate
+    
+    categories, brands, products = await search_consolidated(collection, test_query, None, 5, 5, 10, False)
+    
+    assert categories == [sample_categories[0]]
+    assert brands == [BrandResult(id="MetalTech", name="MetalTech", productCount=3)]
+    assert products == []
+    # Only the brand prefix match runs with the case-insensitive collation
+    collations = [call.kwargs.get("collation") for call in collection.aggregate.call_args_list]
+    assert collations.count(CASE_INSENSITIVE_COLLATION) == 1
+    assert collations.count(None) == 2
+
+def test_categories_pipeline_escapes_query():
+    """Test that regex metacharacters in the query are matched literally"""
+    pipeline = categories_pipeline("c++ (kit)", 5)
+    
+    for stage in (pipeline[0], pipeline[2]):
+        for clause in stage["$match"]["$or"]:
+            assert next(iter(clause.values()))["$regex"] == r"c\+\+\ \(kit\)"
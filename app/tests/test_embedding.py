@@ -0,0 +1,42 @@
+"""
+Test module for query embedding in the embedding service
+"""
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from services.cache import embedding_cache
+from services.embedding import embedding_service
+
+
+@pytest.mark.asyncio
+async def test_embed_query_sends_original_case_to_model():
+    """Test that only the cache key is lowercased, not the text the model embeds"""
+    embedding_cache.clear()
+    with patch.object(embedding_service, "generate_embeddings_async", new_callable=AsyncMock) as mock_generate:
+        mock_generate.return_value = [[0.5] * 384]
+
+        assert await embedding_service.embed_query("  Nike   Shoes ") == [0.5] * 384
+        mock_generate.assert_called_once_with(["Nike Shoes"])
+
+        # A case variant of the same query is served from the cache
+        assert await embedding_service.embed_query("nike shoes") == [0.5] * 384
+        mock_generate.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_embed_query_restarts_failed_batcher():
+    """Test that a batcher that dies fails its waiting queries and is replaced on the next call"""
+    embedding_cache.clear()
+
+    async def broken_batcher(queue):
+        raise RuntimeError("batcher crashed")
+
+    with patch.object(embedding_service, "_run_query_batcher", broken_batcher):
+        with pytest.raises(RuntimeError):
+            await embedding_service.embed_query("winter boots")
+    assert embedding_service._query_batcher_task is None
+
+    with patch.object(embedding_service, "generate_embeddings_async", new_callable=AsyncMock) as mock_generate:
+        mock_generate.return_value = [[0.5] * 384]
+
+        assert await embedding_service.embed_query("winter boots") == [0.5] * 384
@@ -3,14 +3,17 @@ import sys
 import pytest
 import json
 from fastapi.testclient import TestClient
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, AsyncMock, patch
 from typing import Dict, List, Any
+from bson import Binary
+from pymongo import ReplaceOne
 
 # Add parent directory to path to import app modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Import app for testing
 from main import app
+from routers.search import SEARCH_CANDIDATES
 
 # Create a test client
 client = TestClient(app)
@@ -70,7 +73,7 @@ SAMPLE_FEEDBACK = {
 # Override API key dependency for testing
 @pytest.fixture(autouse=True)
 def override_dependencies():
-    with patch("dependencies.API_KEY", TEST_API_KEY):
+    with patch("dependencies._API_KEY_BYTES", TEST_API_KEY.encode()):
         yield
 
 # Tests for POST /ingestProducts
@@ -79,12 +82,12 @@ def test_ingest_products():
     # Mock database operations
     with patch("routers.products.get_product_collection") as mock_get_collection:
         mock_collection = Mock()
-        mock_collection.replace_one.return_value = Mock(upserted_id="test_prod1")
+        mock_collection.bulk_write = AsyncMock(return_value=Mock(upserted_count=1, matched_count=0, deleted_count=0))
         mock_get_collection.return_value = mock_collection
         
         # Mock embedding service
-        with patch("services.embedding.embedding_service.generate_embedding") as mock_embedding:
-            mock_embedding.return_value = [0.1] * 384  # Dummy embedding vector
+        with patch("services.embedding.embedding_service.generate_embeddings") as mock_embedding:
+            mock_embedding.side_effect = lambda texts: [[0.1] * 384 for _ in texts]  # Dummy embedding vectors
             
             response = client.post(
                 "/ingestProducts",
@@ -93,11 +96,61 @@ def test_ingest_products():
             )
             
             assert response.status_code == 201
-            assert "test_prod1" in response.json()
+            assert response.json() == ["test_prod1"]
+            
+            # Verify that titles and descriptions were embedded in a single batch
+            mock_embedding.assert_called_once_with([SAMPLE_PRODUCT["title"], SAMPLE_PRODUCT["description"]])
+            
+            # Verify one unordered bulk write with an upsert per product
+            mock_collection.bulk_write.assert_called_once()
+            operations = mock_collection.bulk_write.call_args.args[0]
+            assert mock_collection.bulk_write.call_args.kwargs == {"ordered": False}
+            assert len(operations) == 1
+            assert isinstance(operations[0], ReplaceOne)
+            assert operations[0]._filter == {"id": "test_prod1"}
+            assert operations[0]._upsert is True
+            assert operations[0]._doc["title"] == SAMPLE_PRODUCT["title"]
+            assert isinstance(operations[0]._doc["title_embedding"], Binary)
+
+def test_ingest_products_reports_counts():
+    """Test that /ingest/products reports the bulk write's inserted and updated counts"""
+    with patch("routers.ingest.get_product_collection") as mock_get_collection:
+        mock_collection = Mock()
+        # The first product is new, the second one already existed
+        mock_collection.bulk_write = AsyncMock(return_value=Mock(upserted_count=1, matched_count=1, deleted_count=0))
+        mock_get_collection.return_value = mock_collection
+        
+        with patch("services.embedding.embedding_service.generate_embeddings") as mock_embedding:
+            mock_embedding.side_effect = lambda texts: [[0.1] * 384 for _ in texts]  # Dummy embedding vectors
+            
+            response = client.post(
+                "/ingest/products",
+                headers=HEADERS,
+                json=[SAMPLE_PRODUCT, {**SAMPLE_PRODUCT, "id": "test_prod2"}]
+            )
+            
+            assert response.status_code == 201
+            assert response.json()["inserted"] == 1
+            assert response.json()["updated"] == 1
+            assert response.json()["failed"] == 0
             
-            # Verify that the embedding generation was called correctly
-            mock_embedding.assert_any_call(SAMPLE_PRODUCT["title"])
-            mock_embedding.assert_any_call(SAMPLE_PRODUCT["description"])
+            operations = mock_collection.bulk_write.call_args.args[0]
+            assert [operation._filter for operation in operations] == [{"id": "test_prod1"}, {"id": "test_prod2"}]
+
+def test_batch_import_rejects_invalid_products():
+    """Test that an invalid batch-import item is a 422 and nothing is ingested"""
+    with patch("routers.ingest.ingest_products", new_callable=AsyncMock) as mock_ingest_products, \
+         patch("routers.ingest.ingest_orderlines", new_callable=AsyncMock) as mock_ingest_orderlines:
+        response = client.post(
+            "/ingest/batch-import",
+            headers=HEADERS,
+            json={"products": [{"id": "broken"}], "orderlines": [SAMPLE_ORDERLINE]}
+        )
+        
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["loc"][:3] == ["body", "products", 0]
+        mock_ingest_products.assert_not_called()
+        mock_ingest_orderlines.assert_not_called()
 
 # Tests for POST /ingestOrderline
 def test_ingest_orderline():
@@ -126,14 +179,14 @@ def test_search():
     with patch("routers.search.get_product_collection") as mock_get_collection:
         mock_collection = Mock()
         
-        # Mock the aggregate cursor
+        # Mock the aggregate cursor returning the single $facet document
         mock_cursor = Mock()
-        mock_cursor.__aiter__.return_value = [SAMPLE_PRODUCT]
+        mock_cursor.to_list = AsyncMock(return_value=[{"results": [SAMPLE_PRODUCT], "total": [{"count": 1}]}])
         mock_collection.aggregate.return_value = mock_cursor
         mock_get_collection.return_value = mock_collection
         
         # Mock embedding service
-        with patch("services.embedding.embedding_service.generate_embedding") as mock_embedding:
+        with patch("services.embedding.embedding_service.embed_query", new_callable=AsyncMock) as mock_embedding:
             mock_embedding.return_value = [0.1] * 384  # Dummy embedding vector
             
             # Mock cache
@@ -155,6 +208,71 @@ def test_search():
                     # Verify embedding generation was called
                     mock_embedding.assert_called_once_with(SAMPLE_SEARCH_QUERY["query"])
 
+def test_search_total_counts_all_matches():
+    """Test that the search total is read from the $facet total branch, not the page size"""
+    with patch("routers.search.get_product_collection") as mock_get_collection:
+        mock_collection = Mock()
+
+        # One product on the page out of 57 matches
+        mock_cursor = Mock()
+        mock_cursor.to_list = AsyncMock(side_effect=lambda length: [{"results": [SAMPLE_PRODUCT], "total": [{"count": 57}]}])
+        mock_collection.aggregate.return_value = mock_cursor
+        mock_get_collection.return_value = mock_collection
+
+        with patch("services.embedding.embedding_service.embed_query", new_callable=AsyncMock) as mock_embedding:
+            mock_embedding.return_value = [0.1] * 384  # Dummy embedding vector
+
+            with patch("services.cache.search_cache.get", return_value=None), \
+                 patch("services.cache.search_cache.set"):
+                response = client.post(
+                    "/search",
+                    headers=HEADERS,
+                    json={**SAMPLE_SEARCH_QUERY, "limit": 1}
+                )
+
+                assert response.status_code == 200
+                assert len(response.json()["products"]) == 1
+                assert response.json()["total"] == 57
+
+                # The total counts the fused candidates after the filters, and
+                # each branch retrieves max(SEARCH_CANDIDATES, offset + limit) of them
+                pipeline = mock_collection.aggregate.call_args.args[0]
+                assert pipeline[-1]["$facet"]["total"] == [{"$count": "count"}]
+                assert pipeline[0]["$vectorSearch"]["limit"] == SEARCH_CANDIDATES
+
+def test_search_facets_follow_filters():
+    """Test that every facet is counted over the filtered results"""
+    with patch("routers.search.get_product_collection") as mock_get_collection:
+        mock_collection = Mock()
+
+        mock_cursor = Mock()
+        mock_cursor.to_list = AsyncMock(side_effect=lambda length: [{
+            "results": [SAMPLE_PRODUCT],
+            "total": [{"count": 1}],
+            "brand_values": [{"_id": "TestBrand", "count": 1}],
+            "color_values": [{"_id": "blue", "count": 1}]
+        }])
+        mock_collection.aggregate.return_value = mock_cursor
+        mock_get_collection.return_value = mock_collection
+
+        with patch("services.embedding.embedding_service.embed_query", new_callable=AsyncMock) as mock_embedding:
+            mock_embedding.return_value = [0.1] * 384  # Dummy embedding vector
+
+            with patch("services.cache.search_cache.get", return_value=None), \
+                 patch("services.cache.search_cache.set"):
+                response = client.post("/search", headers=HEADERS, json=SAMPLE_SEARCH_QUERY)
+
+                assert response.status_code == 200
+                facets = {facet["field"]: facet["values"] for facet in response.json()["facets"]}
+                assert facets["color"] == [{"value": "blue", "count": 1}]
+
+                # One aggregation, with the filter applied before every facet branch
+                mock_collection.aggregate.assert_called_once()
+                pipeline = mock_collection.aggregate.call_args.args[0]
+                assert pipeline[-2] == {"$match": SAMPLE_SEARCH_QUERY["filters"]}
+                assert {"brand_values", "color_values", "ageBucket_values", "isOnSale_values",
+                        "seasons_values"} <= set(pipeline[-1]["$facet"])
+
 # Tests for POST /autosuggest
 def test_autosuggest():
     """Test autosuggest endpoint"""
@@ -250,7 +368,7 @@ def test_health():
 def test_query_explain():
     """Test query explain endpoint"""
     # Mock embedding service
-    with patch("services.embedding.embedding_service.generate_embedding") as mock_embedding:
+    with patch("services.embedding.embedding_service.embed_query", new_callable=AsyncMock) as mock_embedding:
         # Return a simple embedding vector
         mock_embedding.return_value = [0.1] * 384
         
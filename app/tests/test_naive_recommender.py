@@ -126,7 +126,7 @@ SAMPLE_ORDERLINES = [
 @pytest.fixture(autouse=True)
 def override_dependencies(monkeypatch):
     """Override API key dependency for testing"""
-    monkeypatch.setattr("app.dependencies.API_KEY", TEST_API_KEY)
+    monkeypatch.setattr("app.dependencies._API_KEY_BYTES", TEST_API_KEY.encode())
 
 @pytest.fixture(scope="module")
 def setup_recommender_data():
@@ -44,7 +44,7 @@ SAMPLE_PRODUCT = {
 @pytest.fixture(autouse=True)
 def override_dependencies(monkeypatch):
     """Override API key dependency for testing"""
-    monkeypatch.setattr("app.dependencies.API_KEY", TEST_API_KEY)
+    monkeypatch.setattr("app.dependencies._API_KEY_BYTES", TEST_API_KEY.encode())
 
 def test_ingest_products():
     """Test product ingestion endpoint"""
@@ -0,0 +1,53 @@
+"""
+Test module for the semantic search response cache
+"""
+import pytest
+
+from services.semantic_cache import SemanticCache
+
+
+def test_lookup_hits_similar_embedding_with_same_context():
+    """Test that a near-identical embedding reuses the cached response"""
+    cache = SemanticCache(dim=3, max_size=10, threshold=0.97, ttl_seconds=60)
+    cache.store([1.0, 0.0, 0.0], {"products": ["prod1"]}, {"limit": 10})
+
+    assert cache.lookup([0.99, 0.05, 0.0], {"limit": 10}) == {"products": ["prod1"]}
+    assert cache.lookup([0.0, 1.0, 0.0], {"limit": 10}) is None
+    assert cache.lookup([1.0, 0.0, 0.0], {"limit": 20}) is None
+
+
+def test_context_key_order_does_not_matter():
+    """Test that contexts differing only in key order share entries"""
+    cache = SemanticCache(dim=2, max_size=10, threshold=0.97, ttl_seconds=60)
+    cache.store([1.0, 0.0], "shoes", {"filters": {"color": "blue", "brand": "TestBrand"}, "limit": 10})
+
+    assert cache.lookup([1.0, 0.0], {"limit": 10, "filters": {"brand": "TestBrand", "color": "blue"}}) == "shoes"
+    assert cache.lookup([1.0, 0.0], {"limit": 10, "filters": {"brand": "TestBrand"}}) is None
+
+
+def test_store_evicts_least_recently_used():
+    """Test that a full cache evicts the entry that was used least recently"""
+    cache = SemanticCache(dim=2, max_size=2, threshold=0.97, ttl_seconds=60)
+    cache.store([1.0, 0.0], "first")
+    cache.store([0.0, 1.0], "second")
+    cache.lookup([1.0, 0.0])
+    cache.store([-1.0, 0.0], "third")
+
+    assert cache.lookup([1.0, 0.0]) == "first"
+    assert cache.lookup([0.0, 1.0]) is None
+    assert cache.lookup([-1.0, 0.0]) == "third"
+
+
+def test_invalidate_by_product_removes_tagged_entries():
+    """Test that invalidating a product drops only the responses containing it"""
+    cache = SemanticCache(dim=2, max_size=10, threshold=0.97, ttl_seconds=60)
+    cache.store([1.0, 0.0], "shoes", product_ids=["prod1"])
+    cache.store([0.0, 1.0], "hats", product_ids=["prod3"])
+
+    assert cache.invalidate_by_product("prod1") == 1
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.lookup([0.0, 1.0]) == "hats"
+
+
+if __name__ == "__main__":
+    pytest.main(["-xvs", __file__])
@@ -98,7 +98,7 @@ class MockCollection:
         result.inserted_id = document.get("id", "test_id")
         return result
     
-    async def insert_many(self, documents: List[Dict[str, Any]]) -> MagicMock:
+    async def insert_many(self, documents: List[Dict[str, Any]], ordered: bool = True) -> MagicMock:
         """Mock insert_many operation"""
         self.operations.append(("insert_many", documents))
         self.data.extend(documents)
@@ -188,6 +188,11 @@ class MockCollection:
                 
         return count
     
+    async def estimated_document_count(self) -> int:
+        """Mock estimated_document_count operation"""
+        self.operations.append(("estimated_document_count",))
+        return len(self.data)
+    
     async def replace_one(self, filter_query: Dict[str, Any], 
                           replacement: Dict[str, Any], 
                           upsert: bool = False) -> MagicMock:
@@ -309,12 +314,13 @@ def get_test_patches() -> List[patch]:
     
     # Create patches
     patches = [
-        patch("dependencies.API_KEY", TEST_API_KEY),
+        patch("dependencies._API_KEY_BYTES", TEST_API_KEY.encode()),
         patch("database.mongodb.get_db", AsyncMock(return_value=mock_db)),
-        patch("database.mongodb.get_product_collection", AsyncMock(return_value=mock_db.products)),
-        patch("database.mongodb.get_orderlines_collection", AsyncMock(return_value=mock_db.orderlines)),
-        patch("database.mongodb.get_product_pairs_collection", AsyncMock(return_value=mock_db.product_pairs)),
-        patch("services.embedding.embedding_service.generate_embedding", MagicMock(return_value=[0.1] * 384))
+        patch("database.mongodb.products_collection", mock_db.products),
+        patch("database.mongodb.orderlines_collection", mock_db.orderlines),
+        patch("database.mongodb.product_pairs_collection", mock_db.product_pairs),
+        patch("services.embedding.embedding_service.generate_embedding", MagicMock(return_value=[0.1] * 384)),
+        patch("services.embedding.embedding_service.embed_query", AsyncMock(return_value=[0.1] * 384))
     ]
     
     return patches
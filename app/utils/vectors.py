@@ -0,0 +1,36 @@
+"""
+Helpers for storing embedding vectors as packed BSON binary data.
+
+Embeddings are stored in the BSON vector format (binData subtype 9) with
+float32 elements instead of BSON arrays of doubles. This halves the stored
+size and avoids per-element key parsing when documents are decoded.
+"""
+from typing import Any, Iterable, Union
+
+import numpy as np
+from bson.binary import Binary
+
+# BSON binary subtype for vectors
+VECTOR_SUBTYPE = 9
+
+# Header of a float32 BSON vector: dtype byte followed by the padding byte
+FLOAT32_VECTOR_HEADER = b"\x27\x00"
+
+
+def pack_embedding(values: Union[Iterable[float], np.ndarray]) -> Binary:
+    """
+    Pack an embedding into a float32 BSON vector for MongoDB storage.
+    """
+    data = np.asarray(values, dtype="<f4").tobytes()
+    return Binary(FLOAT32_VECTOR_HEADER + data, VECTOR_SUBTYPE)
+
+
+def unpack_embedding(value: Any) -> np.ndarray:
+    """
+    Unpack a stored embedding into a float32 numpy array.
+    Documents written before embeddings were packed still hold plain lists,
+    so those are converted as-is.
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return np.frombuffer(value, dtype="<f4", offset=len(FLOAT32_VECTOR_HEADER))
+    return np.asarray(value, dtype=np.float32)
@@ -33,24 +33,19 @@ def check_atlas_connection(mongodb_uri):
         return None
 
 def get_index_definition():
-    """Return the vector search index definition"""
+    """
+    Return the Atlas Search index definition.
+    Embeddings are not mapped here; they are indexed by the separate
+    vector_index vector search index, which the API creates on startup.
+    """
     return {
         "mappings": {
             "dynamic": True,
             "fields": {
-                "title_embedding": {
-                    "type": "knnVector",
-                    "dimensions": 384,
-                    "similarity": "cosine"
-                },
-                "description_embedding": {
-                    "type": "knnVector",
-                    "dimensions": 384,
-                    "similarity": "cosine"
-                },
-                "title": {
-                    "type": "string"
-                },
+                "title": [
+                    {"type": "string"},
+                    {"type": "autocomplete"}
+                ],
                 "description": {
                     "type": "string"
                 },
@@ -116,7 +111,7 @@ def display_setup_instructions():
     index_definition = get_index_definition()
     
     print("\n==== Atlas Search Setup Instructions ====")
-    print("\nTo create a vector search index in MongoDB Atlas:")
+    print("\nTo create the Atlas Search index in MongoDB Atlas:")
     print("1. Log in to your MongoDB Atlas account")
     print("2. Navigate to your cluster")
     print("3. Click on 'Search' tab")
@@ -129,6 +124,7 @@ def display_setup_instructions():
     print("7. Select the 'productdb.products' namespace")
     print("8. Click 'Create Search Index'")
     print("\nNote: Index creation may take a few minutes to complete.")
+    print("The 'vector_index' vector search index on the embeddings is created by the API on startup.")
 
 def main():
     parser = argparse.ArgumentParser(description="Set up and validate MongoDB Atlas search index")
@@ -21,6 +21,7 @@ sys.path.append(parent_dir)
 
 from app.services.naive_recommender import NaiveRecommender
 from app.services.embedding import embedding_service
+from app.utils.vectors import pack_embedding
 
 
 class RecommenderTester:
@@ -53,10 +54,13 @@ class RecommenderTester:
         
         # Generate embeddings for products (optional)
         print("Generating embeddings for products...")
-        for product in products:
-            # Generate embeddings for title and description
-            product["title_embedding"] = embedding_service.generate_embedding(product["title"])
-            product["description_embedding"] = embedding_service.generate_embedding(product["description"])
+        embeddings = embedding_service.generate_embeddings(
+            [product["title"] for product in products] + [product["description"] for product in products]
+        )
+        for i, product in enumerate(products):
+            # Store title and description embeddings as packed float32 vectors, like the API does
+            product["title_embedding"] = pack_embedding(embeddings[i])
+            product["description_embedding"] = pack_embedding(embeddings[len(products) + i])
         
         # Insert products
         if products: